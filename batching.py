@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+
+# Maximum number of texts DeepL accepts in a single translate request
+DEEPL_MAX_TEXTS = 50
+# Maximum size of a translate request body accepted by DeepL, with some room left for the other fields
+DEEPL_MAX_BYTES = 120 * 1024
+
+
+# This class collects the translations requested within a few milliseconds and sends them to DeepL in batches
+class Batcher:
+    def __init__(self, send, max_size=DEEPL_MAX_TEXTS, max_delay=0.005, max_bytes=DEEPL_MAX_BYTES, acquire=None):
+        # Coroutine function sending a list of texts for a (source, target, glossary) group, it returns the results
+        # in order
+        self.send = send
+        # Optional coroutine function waiting for the rate limiter, a batch keeps collecting texts while it waits
+        self.acquire = acquire
+        # Maximum number of texts in a batch
+        self.max_size = min(max_size, DEEPL_MAX_TEXTS)
+        # Maximum number of seconds a text waits for other texts before the batch is sent
+        self.max_delay = max_delay
+        # Maximum total size of the texts in a batch
+        self.max_bytes = min(max_bytes, DEEPL_MAX_BYTES)
+        # Mapping (source, target, glossary id) -> batch being collected
+        self._pending = {}
+        # Batches currently being sent, kept to avoid their garbage collection
+        self._sending = set()
+        # Counters exposed as metrics
+        self.batches = 0
+        self.texts = 0
+        self.flush_seconds = 0.0
+
+    # Async method to translate a text as part of a batch, it returns the (text, detected_source) pair.
+    # Only the texts using the same glossary are sent together
+    async def submit(self, text, source="", target="EN-GB", glossary_id=None):
+        key = (source or "", target, glossary_id)
+        size = len(text.encode("utf-8"))
+        batch = self._pending.get(key)
+        # A text that does not fit in the current batch causes it to be sent first
+        if batch and (len(batch.texts) >= self.max_size or batch.size + size > self.max_bytes):
+            self._close(key)
+            batch = None
+        if batch is None:
+            batch = _Batch()
+            self._pending[key] = batch
+            # The batch is sent when its delay expires, unless it fills up before
+            batch.timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush, key)
+        future = asyncio.get_running_loop().create_future()
+        batch.texts.append(text)
+        batch.futures.append(future)
+        batch.size += size
+        if len(batch.texts) >= self.max_size:
+            self._close(key)
+        return await future
+
+    # Internal method to send a batch in the background once its delay expires.
+    # The batch stays open until the rate limiter lets it through, so it keeps growing while DeepL is throttled
+    def _flush(self, key):
+        batch = self._pending.get(key)
+        if batch is None or batch.task is not None:
+            return
+        batch.timer.cancel()
+        batch.task = asyncio.ensure_future(self._send(key, batch))
+        self._sending.add(batch.task)
+        batch.task.add_done_callback(self._sending.discard)
+
+    # Internal method to stop collecting a full batch, it is sent as soon as the rate limiter allows it
+    def _close(self, key):
+        self._flush(key)
+        self._pending.pop(key, None)
+
+    # Internal async method that sends a batch and fans the results out to the waiting callers
+    async def _send(self, key, batch):
+        source, target, glossary_id = key
+        if self.acquire is not None:
+            try:
+                await self.acquire()
+            finally:
+                # The texts submitted from now on go to a new batch
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+        start = time.perf_counter()
+        try:
+            results = await self.send(batch.texts, source=source, target=target, glossary_id=glossary_id)
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+            self.texts += len(batch.texts)
+            self.flush_seconds += time.perf_counter() - start
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    # Returns the counters of the batcher
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "average_flush_seconds": self.flush_seconds / self.batches if self.batches else 0.0,
+            "pending_batches": len(self._pending),
+            "max_size": self.max_size,
+            "max_delay": self.max_delay,
+        }
+
+
+# This class holds the texts of a batch being collected and the futures of their callers
+class _Batch:
+    def __init__(self):
+        self.texts = []
+        self.futures = []
+        self.size = 0
+        self.timer = None
+        # Task sending the batch, set when it starts waiting for the rate limiter
+        self.task = None
+
+
+# Function to create a batcher from the environment variables
+def from_env(send, acquire=None):
+    return Batcher(
+        send,
+        max_size=int(os.getenv("BATCH_MAX_SIZE", str(DEEPL_MAX_TEXTS))),
+        max_delay=float(os.getenv("BATCH_MAX_DELAY_MS", "5")) / 1000,
+        max_bytes=int(os.getenv("BATCH_MAX_BYTES", str(DEEPL_MAX_BYTES))),
+        acquire=acquire,
+    )
@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+# The bot modules read their configuration at import time, the benchmark must be configured before importing them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("TOKEN_DEEPL", "benchmark:fx")
+
+import aiohttp  # noqa: E402
+from benchmarks.fake_deepl import FakeDeepL  # noqa: E402
+from benchmarks.fake_discord import FakeBot, FakeChannel, FakeGuild, FakeInteraction, FakeMessage  # noqa: E402
+from benchmarks.fake_discord import FakeReactionPayload, FakeUser  # noqa: E402
+
+
+# Function to compute a percentile of a sorted list of samples
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+# Async function to run the benchmark and return its report
+async def run(args):
+    server = FakeDeepL(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                       throttle_rate=args.throttle_rate, seed=args.seed)
+    os.environ["DEEPL_API_URL"] = await server.start()
+    os.environ["CACHE_PATH"] = os.path.join(args.workdir, "cache.db") if args.disk_cache else ""
+    os.environ["DEEPL_RATE"] = str(args.deepl_rate)
+    os.environ["DEEPL_GUILD_RATE"] = str(args.guild_rate)
+    os.environ["USAGE_PATH"] = os.path.join(args.workdir, "usage.json")
+
+    import translation
+    import job_queue
+    from cogs.translator_command import TranslatorCommand
+    from job_queue import INTERACTION
+
+    rng = random.Random(args.seed)
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60))
+    translation.init_client(session)
+    await translation.refresh_languages(path=os.path.join(args.workdir, "languages.json"))
+    jobs = job_queue.JobQueue(workers=args.workers, max_depth=args.queue_size)
+    jobs.start()
+    bot = FakeBot(jobs)
+    cog = TranslatorCommand(bot)
+
+    # Build the synthetic server: guilds, channels and a pool of messages, some of them repeated
+    guilds = [FakeGuild() for _ in range(args.guilds)]
+    channels = [FakeChannel(guild) for guild in guilds]
+    for channel in channels:
+        bot.add_channel(channel)
+    texts = [f"Benchmark message number {i}, with some words to translate." for i in range(args.unique_texts)]
+    messages = [FakeMessage(rng.choice(channels), rng.choice(texts)) for _ in range(args.unique_texts)]
+    flags = list(translation.get_flags())
+    targets = list(translation.get_target_language().values())
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    # Async function to send a single synthetic event through the cog and measure its latency
+    async def event():
+        async with semaphore:
+            start = time.perf_counter()
+            if rng.random() < args.reaction_share:
+                message = rng.choice(messages)
+                await cog.on_raw_reaction_add(FakeReactionPayload(message, rng.choice(flags), FakeUser()))
+            else:
+                interaction = FakeInteraction(rng.choice(channels))
+                text = rng.choice(texts)
+                await cog.queue_translation(INTERACTION, interaction=interaction, message=text,
+                                            text_to_translate=text, target_lang_code=rng.choice(targets),
+                                            author=interaction.user)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(event() for _ in range(args.events)))
+    elapsed = time.perf_counter() - start
+
+    await jobs.stop()
+    await session.close()
+    await server.stop()
+    translation.translation_cache.close()
+
+    latencies.sort()
+    return {
+        "events": args.events,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(args.events / elapsed, 1),
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)},
+        "upstream": {**server.calls, "texts": server.texts, "characters": server.characters},
+        "cache": translation.translation_cache.stats(),
+        "batcher": translation.batcher.stats(),
+        "queue": jobs.stats(),
+        "coalesced": translation.in_flight.coalesced,
+        "message_fetches": sum(channel.fetches for channel in channels),
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the translator against a fake DeepL server")
+    parser.add_argument("--events", type=int, default=2000, help="number of synthetic events")
+    parser.add_argument("--concurrency", type=int, default=200, help="events in flight at the same time")
+    parser.add_argument("--reaction-share", type=float, default=0.8, help="fraction of events that are reactions")
+    parser.add_argument("--unique-texts", type=int, default=200, help="distinct messages, controls the cache hits")
+    parser.add_argument("--guilds", type=int, default=20, help="number of synthetic guilds")
+    parser.add_argument("--latency-ms", type=float, default=50, help="average latency of the fake DeepL")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="latency jitter of the fake DeepL")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 answers")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of 429 answers")
+    parser.add_argument("--deepl-rate", type=float, default=50, help="requests per second allowed to DeepL")
+    parser.add_argument("--guild-rate", type=float, default=10, help="translations per second allowed to a guild")
+    parser.add_argument("--workers", type=int, default=32, help="workers of the job queue")
+    parser.add_argument("--queue-size", type=int, default=5000, help="maximum depth of the job queue")
+    parser.add_argument("--disk-cache", action="store_true", help="also use the SQLite cache")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generators")
+    parser.add_argument("--json", action="store_true", help="print the report as a single JSON line")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        report = asyncio.run(run(args))
+    print(json.dumps(report) if args.json else json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
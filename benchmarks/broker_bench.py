@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+# The bot modules read their configuration at import time, the benchmark must be configured before importing them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("TOKEN_DEEPL", "benchmark:fx")
+
+import aiohttp  # noqa: E402
+from benchmarks.bench import percentile  # noqa: E402
+from benchmarks.fake_deepl import FakeDeepL  # noqa: E402
+
+
+# Async function translating distinct texts with a bounded concurrency, it returns the sorted latencies and the time
+async def translate_all(translation, texts, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def translate(text):
+        async with semaphore:
+            start = time.perf_counter()
+            await translation.translation(text, target="DE", guild_id=1, channel_id=2, user_id=3)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(translate(text) for text in texts))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return latencies, elapsed
+
+
+# Function to summarize a run
+def summary(latencies, elapsed):
+    return {
+        "seconds": round(elapsed, 3),
+        "translations_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)},
+    }
+
+
+# Async function to run the same load in the bot process and through the broker, and return the report
+async def run(args):
+    server = FakeDeepL(latency=args.latency_ms / 1000, jitter=0.0)
+    os.environ["DEEPL_API_URL"] = await server.start()
+    os.environ["CACHE_PATH"] = ""
+    os.environ["DEEPL_RATE"] = "1000000"
+    os.environ["DEEPL_GUILD_RATE"] = "1000000"
+    os.environ["DEEPL_GUILD_BURST"] = "1000000"
+    os.environ["LANGUAGES_SNAPSHOT"] = os.path.join(args.workdir, "languages.json")
+    os.environ["USAGE_PATH"] = os.path.join(args.workdir, "usage.json")
+    os.environ["TRANSLATION_BROKER"] = os.path.join(args.workdir, "broker.sock")
+    os.environ["WORKER_SLOTS"] = str(args.slots)
+
+    import broker
+    import translation
+
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60))
+    translation.init_client(session)
+    # The snapshot is read by the workers at startup
+    await translation.refresh_languages()
+    report = {"translations": args.translations, "concurrency": args.concurrency, "workers": args.workers}
+
+    # Every text is distinct, so each translation reaches the fake DeepL in both runs
+    texts = [f"Broker benchmark message number {i}, sent in process." for i in range(args.translations)]
+    report["in_process"] = summary(*await translate_all(translation, texts, args.concurrency))
+
+    translation.remote = broker.from_env(on_usage=translation.record_remote_usage)
+    await translation.remote.start()
+    workers = [await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, "worker.py"),
+                                                    stdout=asyncio.subprocess.DEVNULL,
+                                                    stderr=asyncio.subprocess.DEVNULL)
+               for _ in range(args.workers)]
+    start = time.perf_counter()
+    while len(translation.remote.workers) < args.workers:
+        await asyncio.sleep(0.05)
+    report["workers_ready_seconds"] = round(time.perf_counter() - start, 3)
+
+    texts = [f"Broker benchmark message number {i}, sent to a worker." for i in range(args.translations)]
+    report["through_broker"] = summary(*await translate_all(translation, texts, args.concurrency))
+    report["overhead_ms"] = {p: round(report["through_broker"]["latency_ms"][p] - report["in_process"]["latency_ms"][p], 2)
+                             for p in report["in_process"]["latency_ms"]}
+    report["broker"] = translation.remote.stats()
+    report["usage_characters"] = translation.usage_tracker.total()
+    report["upstream"] = {**server.calls, "texts": server.texts}
+
+    for worker in workers:
+        worker.terminate()
+        await worker.wait()
+    await translation.remote.stop()
+    await session.close()
+    await server.stop()
+    translation.translation_cache.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round-trip overhead of the translation workers against a fake DeepL")
+    parser.add_argument("--translations", type=int, default=2000, help="number of distinct texts of each run")
+    parser.add_argument("--concurrency", type=int, default=200, help="translations in flight at the same time")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes started")
+    parser.add_argument("--slots", type=int, default=64, help="jobs run at the same time by each worker")
+    parser.add_argument("--latency-ms", type=float, default=20, help="latency of the fake DeepL")
+    parser.add_argument("--json", action="store_true", help="print the report as a single JSON line")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        report = asyncio.run(run(args))
+    print(json.dumps(report) if args.json else json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import asyncio
+import random
+from aiohttp import web
+
+# Languages served by the fake /languages endpoint, language code -> language name
+SOURCE_LANGUAGES = {
+    "AR": "Arabic", "BG": "Bulgarian", "CS": "Czech", "DA": "Danish", "DE": "German", "EL": "Greek",
+    "EN": "English", "ES": "Spanish", "ET": "Estonian", "FI": "Finnish", "FR": "French", "HU": "Hungarian",
+    "ID": "Indonesian", "IT": "Italian", "JA": "Japanese", "KO": "Korean", "LT": "Lithuanian", "LV": "Latvian",
+    "NB": "Norwegian", "NL": "Dutch", "PL": "Polish", "PT": "Portuguese", "RO": "Romanian", "RU": "Russian",
+    "SK": "Slovak", "SL": "Slovenian", "SV": "Swedish", "TR": "Turkish", "UK": "Ukrainian", "ZH": "Chinese",
+}
+TARGET_LANGUAGES = {
+    **{code: name for code, name in SOURCE_LANGUAGES.items() if code not in ("EN", "PT", "ZH")},
+    "EN-GB": "English (British)", "EN-US": "English (American)", "PT-BR": "Portuguese (Brazilian)",
+    "PT-PT": "Portuguese (European)", "ZH-HANS": "Chinese (simplified)",
+}
+
+
+# This class is a local stand-in for the DeepL API with configurable latency and error rate
+class FakeDeepL:
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, throttle_rate=0.0, seed=None):
+        # Average seconds spent answering each request, with a random jitter
+        self.latency = latency
+        self.jitter = jitter
+        # Fraction of the translate requests answered with a 503 or a 429
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        # Counters of the requests received
+        self.calls = {"translate": 0, "usage": 0, "languages": 0, "errors": 0}
+        self.texts = 0
+        self.characters = 0
+        self._runner = None
+        self.url = None
+
+    # Builds the aiohttp application with the DeepL endpoints
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v2/translate", self.translate)
+        app.router.add_get("/v2/usage", self.usage)
+        app.router.add_get("/v2/languages", self.languages)
+        return app
+
+    # Async method to start the server on a free local port
+    async def start(self, host="127.0.0.1", port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/v2"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    # Internal async method simulating the time spent by DeepL
+    async def _delay(self):
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+    async def translate(self, request):
+        self.calls["translate"] += 1
+        await self._delay()
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.calls["errors"] += 1
+            return web.Response(status=429, text="Too many requests", headers={"Retry-After": "1"})
+        if roll < self.throttle_rate + self.error_rate:
+            self.calls["errors"] += 1
+            return web.Response(status=503, text="Service unavailable")
+        data = await request.json()
+        texts = data["text"]
+        self.texts += len(texts)
+        self.characters += sum(len(text) for text in texts)
+        # The "translation" tags the text with the target language, the source is detected as English unless given
+        translations = [{"detected_source_language": data.get("source_lang", "EN"),
+                         "text": f"[{data['target_lang']}] {text}"} for text in texts]
+        return web.json_response({"translations": translations})
+
+    async def usage(self, request):
+        self.calls["usage"] += 1
+        await self._delay()
+        return web.json_response({"character_count": self.characters, "character_limit": 500000})
+
+    async def languages(self, request):
+        self.calls["languages"] += 1
+        await self._delay()
+        catalog = TARGET_LANGUAGES if request.query.get("type") == "target" else SOURCE_LANGUAGES
+        return web.json_response([{"language": code, "name": name} for code, name in catalog.items()])
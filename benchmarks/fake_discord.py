@@ -0,0 +1,132 @@
+import itertools
+import discord
+
+# Sequence of the fake snowflake ids
+_ids = itertools.count(1000)
+
+
+# Minimal stand-ins for the discord.py objects used by TranslatorCommand, they record what the bot sends
+class FakeUser:
+    def __init__(self, bot=False):
+        self.id = next(_ids)
+        self.bot = bot
+        self.avatar = None
+        self.sent = []
+
+    async def send(self, *args, **kwargs):
+        self.sent.append(kwargs)
+
+    def __str__(self):
+        return f"user{self.id}"
+
+
+class FakeGuild:
+    def __init__(self):
+        self.id = next(_ids)
+
+
+class FakeChannel:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+        # Messages sent by the bot
+        self.sent = []
+        # Messages that can be fetched, message id -> message
+        self.messages = {}
+        # Number of messages fetched through the API
+        self.fetches = 0
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(self, content or "", author=None)
+        self.sent.append(message)
+        return message
+
+    async def fetch_message(self, message_id):
+        self.fetches += 1
+        return self.messages[message_id]
+
+    def get_partial_message(self, message_id):
+        return self.messages[message_id]
+
+
+class FakeMessage:
+    def __init__(self, channel, content, author=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.author = author or FakeUser()
+        self.attachments = []
+        channel.messages[self.id] = self
+
+    async def edit(self, **kwargs):
+        pass
+
+    async def remove_reaction(self, emoji, member):
+        pass
+
+
+class FakeEmoji:
+    def __init__(self, name):
+        self.id = None
+        self.name = name
+
+
+# Stand-in for discord.RawReactionActionEvent, the payload of on_raw_reaction_add
+class FakeReactionPayload:
+    def __init__(self, message, emoji, user):
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id = message.guild.id
+        self.user_id = user.id
+        self.member = user
+        self.emoji = FakeEmoji(emoji)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(self.interaction.channel, content or "")
+        self.interaction.sent.append(message)
+        return message
+
+
+class FakeResponse:
+    async def defer(self, **kwargs):
+        pass
+
+    async def send_message(self, *args, **kwargs):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, channel, user=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild_id = channel.guild.id
+        self.user = user or FakeUser()
+        self.created_at = discord.utils.utcnow()
+        self.response = FakeResponse()
+        self.followup = FakeFollowup(self)
+        self.sent = []
+
+    async def edit_original_response(self, **kwargs):
+        pass
+
+
+# Minimal stand-in for CustomBot, exposing what the cog reads from the bot
+class FakeBot:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.user = FakeUser(bot=True)
+        # Channels reachable by id
+        self.channels = {}
+
+    def add_channel(self, channel):
+        self.channels[channel.id] = channel
+
+    def get_partial_messageable(self, channel_id, guild_id=None):
+        return self.channels[channel_id]
@@ -1,16 +1,74 @@
+import asyncio
+import collections
 import datetime
+import hashlib
+import json
 import logging
 import os
+import time
 import traceback
 import typing
 import aiohttp
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
+import broker
+import hot_reload
+import job_queue
+import metrics
+import translation
 
+try:
+    # Only available on Unix, the memory of the process is not reported on Windows
+    import resource
+except ImportError:
+    resource = None
 
-# This class extends commands.Bot, providing additional and customized functionality for the Discord bot.
-class CustomBot(commands.Bot):
+# File storing the fingerprint of the command tree of the last sync, per scope ("global" or guild id)
+COMMAND_TREE_STATE = os.getenv("COMMAND_TREE_STATE", "command_tree.json")
+# Seconds between two checks of the extension files and of the emoji configuration, 0 disables the hot reload
+HOT_RELOAD_INTERVAL = float(os.getenv("HOT_RELOAD_INTERVAL", "2"))
+# Hours between two refreshes of the language catalog, and first and maximum delay of the retries before the first
+# successful load, when the bot started without a snapshot while DeepL was not reachable
+LANGUAGES_REFRESH_HOURS = 6
+LANGUAGES_RETRY_DELAY = 5.0
+LANGUAGES_MAX_RETRY_DELAY = 300.0
+
+
+# Function to read the sharding options from the environment variables,
+# SHARD_IDS lets several processes split the shards of the same SHARD_COUNT
+def sharding_from_env() -> dict[str, typing.Any]:
+    options: dict[str, typing.Any] = {}
+    if os.getenv("SHARD_COUNT"):
+        options["shard_count"] = int(os.getenv("SHARD_COUNT"))
+    if os.getenv("SHARD_IDS"):
+        options["shard_ids"] = [int(shard_id) for shard_id in os.getenv("SHARD_IDS").split(",")]
+    return options
+
+
+# Function to build the intents of the bot, the lean profile only keeps what the translator needs
+def intents_for_profile(profile: str) -> discord.Intents:
+    if profile == "full":
+        # Defines the common intents of the bot
+        intents = discord.Intents.default()
+        # Allows the bot to receive events related to members
+        intents.members = True
+    else:
+        # Guilds and channels, messages for edits and auto-translation, nothing related to members or presences
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.guild_messages = True
+        intents.dm_messages = True
+    # # Allows the bot to receive events related to reactions to messages
+    intents.reactions = True
+    # Allows the bot to read the content of messages
+    intents.message_content = True
+    return intents
+
+
+# This class extends commands.AutoShardedBot, providing additional and customized functionality for the Discord bot.
+# With a single shard it behaves like commands.Bot, with more it spreads the guilds over several gateway connections.
+class CustomBot(commands.AutoShardedBot):
     # HTTP client session for making web requests
     client: aiohttp.ClientSession
     # Record the bot's startup time in UTC.
@@ -18,14 +76,18 @@ class CustomBot(commands.Bot):
 
     # Constructor of the CustomBot class. Called when an instance of the bot is created.
     def __init__(self, prefix: str, ext_dir: str, *args: typing.Any, **kwargs: typing.Any) -> None:
-        # Defines the common intents of the bot
-        intents = discord.Intents.default()
-        # Allows the bot to receive events related to members
-        intents.members = True
-        # # Allows the bot to receive events related to reactions to messages
-        intents.reactions = True
-        # Allows the bot to read the content of messages
-        intents.message_content = True
+        # Memory profile of the bot, "lean" (default) or "full"
+        profile = os.getenv("BOT_PROFILE", "lean")
+        intents = intents_for_profile(profile)
+        if profile != "full":
+            # No member is cached or requested at startup, the translator never reads them
+            kwargs.setdefault("member_cache_flags", discord.MemberCacheFlags.none())
+            kwargs.setdefault("chunk_guilds_at_startup", False)
+        # Flag translations read uncached messages through raw events, so a small message cache is enough
+        kwargs.setdefault("max_messages", int(os.getenv("MESSAGE_CACHE_SIZE", "100")))
+        # Shard count and shard ids, discord.py asks Discord for the recommended count when they are not set
+        for key, value in sharding_from_env().items():
+            kwargs.setdefault(key, value)
         # Call the base class constructor
         super().__init__(*args, **kwargs, command_prefix=commands.when_mentioned_or(prefix), intents=intents)
         # Configure the logger for this instance of the bot
@@ -34,6 +96,21 @@ class CustomBot(commands.Bot):
         self.ext_dir = ext_dir
         # Flag to check whether slash command trees have been synchronized.
         self.synced = False
+        # Bounded priority queue of translation jobs, served by a fixed pool of workers
+        self.jobs = job_queue.from_env()
+        # Server exposing the /metrics endpoint and task measuring the event loop lag
+        self.metrics_runner = None
+        self.loop_monitor = None
+        # Delay of the next retry of the language catalog download, while no catalog is loaded
+        self.languages_retry_delay = LANGUAGES_RETRY_DELAY
+        # State handed over by the cogs being reloaded to their new instances, cog name -> state
+        self.carried_state: dict[str, dict[str, typing.Any]] = {}
+        # Watcher of the files applied by the hot reload, created once the extensions are loaded
+        self.watcher: typing.Optional[hot_reload.FileWatcher] = None
+        # Serializes the reloads started by the watcher and by the /reload command
+        self.reload_lock = asyncio.Lock()
+        # Last items reloaded, with their result and latency
+        self.reload_history: collections.deque[dict[str, typing.Any]] = collections.deque(maxlen=20)
 
     # Async method for loading cogs
     async def _load_extensions(self) -> None:
@@ -53,35 +130,306 @@ class CustomBot(commands.Bot):
                     # Handles errors when loading an extension
                     self.logger.error(f"Failed to load extension {filename[:-3]}\n{traceback.format_exc()}")
 
+    # Async method to apply changed files without reconnecting: extensions are loaded, reloaded or unloaded and the
+    # flags are swapped. Without paths every extension and the flags are reloaded. It returns a report for each path
+    async def hot_reload(self, paths: typing.Optional[list[str]] = None) -> list[dict[str, typing.Any]]:
+        if paths is None:
+            paths = [os.path.join(self.ext_dir, filename) for filename in sorted(os.listdir(self.ext_dir))
+                     if filename.endswith(".py") and not filename.startswith("_")] + [translation.EMOJI_CONFIG]
+        report = []
+        async with self.reload_lock:
+            for path in paths:
+                start = time.perf_counter()
+                try:
+                    action, error = await self._reload_path(path), None
+                except Exception as e:
+                    # discord.py puts back the previous version of an extension that fails to load
+                    action, error = "failed", str(e.__cause__ or e)
+                    self.logger.error(f"Failed to reload {path}\n{traceback.format_exc()}")
+                seconds = time.perf_counter() - start
+                metrics.RELOAD_LATENCY.observe(seconds, "failed" if error else "done")
+                item = {"name": os.path.basename(path), "action": action, "seconds": seconds, "error": error,
+                        "time": datetime.datetime.now(datetime.UTC)}
+                report.append(item)
+                self.reload_history.append(item)
+                self.logger.info(f"Hot reload of {item['name']}: {action} in {seconds * 1000:.1f} ms")
+            # The tree is only sent to Discord when the commands themselves changed
+            if any(item["action"] in ("loaded", "reloaded", "unloaded") for item in report):
+                try:
+                    await self._sync_command_tree()
+                except Exception:
+                    self.logger.error(f"Failed to sync command tree after reload\n{traceback.format_exc()}")
+        return report
+
+    # Internal async method applying a changed file, it returns what was done
+    async def _reload_path(self, path: str) -> str:
+        if os.path.abspath(path) == os.path.abspath(translation.EMOJI_CONFIG):
+            # The new index replaces the old one in a single assignment, the reactions are never left without flags
+            return f"{len(translation.load_flags())} flags"
+        name = f"{self.ext_dir}.{os.path.splitext(os.path.basename(path))[0]}"
+        if not os.path.exists(path):
+            if name not in self.extensions:
+                return "skipped"
+            await self.unload_extension(name)
+            return "unloaded"
+        if name not in self.extensions:
+            await self.load_extension(name)
+            return "loaded"
+        # The cogs hand their caches and the work in progress to their new instances
+        cogs = [cog for cog in self.cogs.values() if cog.__module__ == name and hasattr(cog, "export_state")]
+        for cog in cogs:
+            self.carried_state[cog.qualified_name] = cog.export_state()
+        try:
+            await self.reload_extension(name)
+        finally:
+            for cog in cogs:
+                self.carried_state.pop(cog.qualified_name, None)
+        return "reloaded"
+
+    # Background task applying the files changed since the last check, started when HOT_RELOAD_INTERVAL is set
+    @tasks.loop(seconds=max(HOT_RELOAD_INTERVAL, 0.5))
+    async def watch_files(self) -> None:
+        try:
+            changed = await asyncio.to_thread(self.watcher.changes)
+            if changed:
+                await self.hot_reload(changed)
+        except Exception:
+            self.logger.warning(f"Failed to check the files to reload\n{traceback.format_exc()}")
+
+    # Method to compute a stable hash of the application commands registered in the tree
+    def command_tree_fingerprint(self, guild: typing.Optional[discord.abc.Snowflake] = None) -> str:
+        payloads = []
+        for command in self.tree.get_commands(guild=guild):
+            try:
+                payloads.append(command.to_dict(self.tree))
+            except TypeError:
+                # Older discord.py versions build the payload without the tree
+                payloads.append(command.to_dict())
+        payloads.sort(key=lambda payload: (payload.get("type", 1), payload["name"]))
+        return hashlib.sha256(json.dumps(payloads, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    # Async method to sync the command tree globally and to the guilds in SYNC_GUILDS, skipping unchanged trees
+    async def _sync_command_tree(self) -> None:
+        try:
+            with open(COMMAND_TREE_STATE, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        force = os.getenv("FORCE_SYNC") == "1"
+        targets: list[typing.Optional[discord.Object]] = []
+        # Guild syncs are applied instantly, useful while developing the commands. They replace the global sync,
+        # otherwise each command would appear twice in those guilds
+        for guild_id in filter(None, os.getenv("SYNC_GUILDS", "").split(",")):
+            guild = discord.Object(int(guild_id))
+            # The copy is rebuilt from scratch, so a command removed by a hot reload disappears from the guild
+            self.tree.clear_commands(guild=guild)
+            self.tree.copy_global_to(guild=guild)
+            targets.append(guild)
+        # With the shards split across processes, only the process running shard 0 syncs the global commands
+        if not targets and (self.shard_ids is None or 0 in self.shard_ids):
+            targets.append(None)
+        for guild in targets:
+            scope = "global" if guild is None else str(guild.id)
+            fingerprint = self.command_tree_fingerprint(guild)
+            if not force and state.get(scope) == fingerprint:
+                self.logger.info(f"Command tree ({scope}) unchanged, sync skipped")
+                continue
+            start = time.perf_counter()
+            await self.tree.sync(guild=guild)
+            state[scope] = fingerprint
+            self.logger.info(f"Synced command tree ({scope}) in {time.perf_counter() - start:.3f}s")
+        with open(COMMAND_TREE_STATE, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
     # Event that is called when an unhandled error occurs in an event
     async def on_error(self, event_method: str, *args: typing.Any, **kwargs: typing.Any) -> None:
         # Log the error, including the full stack trace for debugging
         self.logger.error(f"An error occurred in {event_method}.\n{traceback.format_exc()}")
 
+    # Async method to load the language catalog, the local snapshot avoids waiting for DeepL at startup
+    async def _load_languages(self) -> None:
+        start = time.perf_counter()
+        if translation.load_language_snapshot():
+            self.logger.info(f"Loaded language snapshot in {time.perf_counter() - start:.3f}s")
+        else:
+            # Without a snapshot the catalog must be downloaded before the extensions are loaded
+            try:
+                await translation.refresh_languages()
+                self.logger.info(f"Downloaded language catalog in {time.perf_counter() - start:.3f}s")
+            except Exception:
+                self.logger.error(f"Failed to download language catalog\n{traceback.format_exc()}")
+        # Keep the catalog up to date in the background, the first run refreshes the snapshot just loaded
+        self.refresh_languages.start()
+
+    # Background task refreshing the language catalog from DeepL.
+    # Until a catalog is loaded, the download is retried with an exponential backoff instead of every 6 hours
+    @tasks.loop(hours=LANGUAGES_REFRESH_HOURS)
+    async def refresh_languages(self) -> None:
+        try:
+            await translation.refresh_languages()
+            self.logger.info("Refreshed language catalog")
+        except Exception:
+            self.logger.warning(f"Failed to refresh language catalog\n{traceback.format_exc()}")
+            if not translation.get_registry().target:
+                self.logger.info(f"No language catalog loaded, retrying in {self.languages_retry_delay:.0f}s")
+                self.refresh_languages.change_interval(seconds=self.languages_retry_delay)
+                self.languages_retry_delay = min(self.languages_retry_delay * 2, LANGUAGES_MAX_RETRY_DELAY)
+            return
+        if self.languages_retry_delay != LANGUAGES_RETRY_DELAY:
+            # The catalog is loaded, back to the regular refreshes
+            self.languages_retry_delay = LANGUAGES_RETRY_DELAY
+            self.refresh_languages.change_interval(hours=LANGUAGES_REFRESH_HOURS)
+
+    # Background task removing the stale and the oldest translations of the persistent cache, so it stays bounded
+    @tasks.loop(hours=float(os.getenv("CACHE_PRUNE_HOURS", "1")))
+    async def prune_cache(self) -> None:
+        try:
+            removed = await translation.translation_cache.prune()
+            if removed:
+                self.logger.info(f"Pruned {removed} cached translations")
+        except Exception:
+            self.logger.warning(f"Failed to prune translation cache\n{traceback.format_exc()}")
+
+    # Background task saving the usage counters, they are kept in memory between two runs
+    @tasks.loop(seconds=int(os.getenv("USAGE_FLUSH_INTERVAL", "60")))
+    async def flush_usage(self) -> None:
+        try:
+            await translation.usage_tracker.flush()
+        except Exception:
+            self.logger.warning(f"Failed to save usage counters\n{traceback.format_exc()}")
+
+    # Background task comparing the local usage counters with the usage of the account reported by DeepL
+    @tasks.loop(minutes=int(os.getenv("USAGE_RECONCILE_MINUTES", "30")))
+    async def reconcile_usage(self) -> None:
+        try:
+            usage = await translation.reconcile_usage()
+            self.logger.info(f"DeepL usage {usage.get('character_count', 0)} of {usage.get('character_limit', 0)} "
+                             f"characters, {usage['untracked_characters']} not counted locally")
+        except Exception:
+            self.logger.warning(f"Failed to reconcile usage\n{traceback.format_exc()}")
+
+    # Background task syncing with DeepL the glossaries changed while it was not reachable, nothing is sent otherwise
+    @tasks.loop(minutes=int(os.getenv("GLOSSARY_SYNC_MINUTES", "10")))
+    async def sync_glossaries(self) -> None:
+        failures = await translation.sync_glossaries()
+        if failures:
+            self.logger.warning(f"Failed to sync {failures} glossaries with DeepL")
+
+    # Async method to start the local /metrics endpoint and register the counters of the translation layer
+    async def _start_metrics(self) -> None:
+        metrics.registry.collector("translator_cache", lambda: translation.translation_cache.stats())
+        metrics.registry.collector("translator_batcher", lambda: translation.batcher.stats())
+        metrics.registry.collector("translator_deepl", lambda: translation.caller.stats())
+        metrics.registry.collector("translator_detection", lambda: translation.detector.stats())
+        metrics.registry.collector("translator_queue", lambda: self.jobs.stats())
+        metrics.registry.collector("translator_usage", lambda: translation.usage_tracker.stats())
+        metrics.registry.collector("translator_broker", lambda: translation.remote.stats())
+        metrics.registry.collector("translator_glossaries", lambda: translation.glossaries.stats())
+        metrics.registry.collector("translator_bot", self._bot_stats)
+        self.loop_monitor = asyncio.create_task(metrics.monitor_event_loop())
+        host, port = metrics.address_from_env()
+        if port:
+            try:
+                self.metrics_runner = await metrics.start_server(host, port)
+                self.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+            except OSError:
+                self.logger.error(f"Failed to start metrics server\n{traceback.format_exc()}")
+
+    # Method returning the counters of the bot, with the peak memory of the process where it can be read
+    def _bot_stats(self) -> dict[str, float]:
+        stats = {"guilds": len(self.guilds), "shards": len(self.shards), "latency_seconds": self.latency}
+        if resource:
+            # ru_maxrss is in kilobytes on Linux
+            stats["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return stats
+
+    # Event that is called when a shard is ready, it reports the startup time and the memory of the process
+    async def on_shard_ready(self, shard_id: int) -> None:
+        guilds = sum(1 for guild in self.guilds if guild.shard_id == shard_id)
+        seconds = self.uptime.total_seconds()
+        metrics.SHARD_READY.set(seconds, shard_id)
+        metrics.SHARD_GUILDS.set(guilds, shard_id)
+        memory = ""
+        if resource:
+            # ru_maxrss is in kilobytes on Linux
+            rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            memory = f", process memory {rss_mb:.1f} MB ({rss_mb / max(1, len(self.shards)):.1f} MB per shard)"
+        self.logger.info(f"Shard {shard_id} ready after {seconds:.2f}s with {guilds} guilds{memory}")
+
     # Event that is called when the bot is ready and connected to Discord
     async def on_ready(self) -> None:
-        self.logger.info(f"Logged in as {self.user} ({self.user.id})")
+        self.logger.info(f"Logged in as {self.user} ({self.user.id}), ready after {self.uptime.total_seconds():.2f}s")
 
     # Async method called during the bot setup process
     async def setup_hook(self) -> None:
-        # Initialize the aiohttp client session
-        self.client = aiohttp.ClientSession()
+        # Measure the time spent in the setup
+        start = time.perf_counter()
+        # Initialize the aiohttp client session, keeping a pool of keep-alive connections to reuse between requests
+        self.client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=int(os.getenv("HTTP_POOL_SIZE", "100")), ttl_dns_cache=300,
+                                           keepalive_timeout=60)
+        )
+        # Build the async DeepL client on top of the shared session
+        translation.init_client(self.client)
+        # With TRANSLATION_BROKER set, the translations run in the worker processes connected to the broker
+        translation.remote = broker.from_env(on_usage=translation.record_remote_usage)
+        if translation.remote:
+            await translation.remote.start()
+            self.logger.info(f"Waiting for translation workers on {translation.remote.path}")
+        # Start the workers of the translation queue
+        self.jobs.start()
+        # Start saving the usage counters and reconciling them with DeepL
+        self.flush_usage.start()
+        self.reconcile_usage.start()
+        # Start syncing the glossaries left unsynced by the last run
+        self.sync_glossaries.start()
+        # Start bounding the persistent cache, the first run happens right away
+        self.prune_cache.start()
+        # Start the instrumentation
+        await self._start_metrics()
+        # Load the language catalog before the extensions that use it
+        await self._load_languages()
         # Load all extensions
         await self._load_extensions()
-        # Sync the command tree slash with Discord.
+        # From now on the changed extensions and flags are applied without restarting
+        if HOT_RELOAD_INTERVAL > 0:
+            self.watcher = hot_reload.FileWatcher(self.ext_dir, [translation.EMOJI_CONFIG])
+            self.watch_files.start()
+        # Sync the command tree slash with Discord, only when the commands changed since the last sync.
         if not self.synced:
-            # Sync slash commands globally
-            await self.tree.sync()
-            # Inverts the synced flag
-            self.synced = not self.synced
-            self.logger.info("Synced command tree")
+            await self._sync_command_tree()
+            self.synced = True
+        self.logger.info(f"Setup completed in {time.perf_counter() - start:.3f}s")
 
     # Async method called when the bot is about to be closed
     async def close(self) -> None:
+        # Stop refreshing the language catalog and watching the files
+        self.refresh_languages.cancel()
+        self.watch_files.cancel()
+        # Stop the workers of the translation queue
+        await self.jobs.stop()
+        # Stop handing translations to the worker processes, they reconnect when the bot is back
+        if translation.remote:
+            await translation.remote.stop()
+        # Stop the usage tasks and save the last counters
+        self.flush_usage.cancel()
+        self.reconcile_usage.cancel()
+        self.sync_glossaries.cancel()
+        self.prune_cache.cancel()
+        if translation.usage_tracker:
+            await translation.usage_tracker.flush()
+        # Stop the instrumentation
+        if self.loop_monitor:
+            self.loop_monitor.cancel()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
         # Call the close method of the base class
         await super().close()
         # Close the aiohttp client session
         await self.client.close()
+        # Close the persistent translation cache
+        if translation.translation_cache:
+            translation.translation_cache.close()
 
     # Method to start the bot, Load the token from .env and start the Discord client
     def run(self, *args: typing.Any, **kwargs: typing.Any) -> None:
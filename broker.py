@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import json
+import os
+
+# Maximum length of a message exchanged with the workers, each message is a line of JSON
+LINE_LIMIT = 1024 * 1024
+
+
+# Exception raised for the jobs left without any worker connected, the caller translates them in its own process
+class NoWorkerError(Exception):
+    pass
+
+
+# Exception raised in the bot process for a translation that failed in a worker
+class RemoteTranslationError(Exception):
+    pass
+
+
+# Function to encode a message as a line of JSON
+def encode(message):
+    return (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+# This class is a worker process connected to the broker
+class WorkerConnection:
+    def __init__(self, reader, writer, slots):
+        self.reader = reader
+        self.writer = writer
+        # Number of jobs the worker runs at the same time
+        self.slots = slots
+        self.free_slots = asyncio.Semaphore(slots)
+        # Jobs sent to the worker and not answered yet, job id -> (job id, arguments, future)
+        self.outstanding = {}
+
+
+# This class runs in the bot process, it hands the translation jobs to the worker processes connected to
+# a Unix socket and returns their replies. The jobs of a worker that disconnects are given to the other ones,
+# so the workers can be restarted or added at any time without touching the gateway connection
+class Broker:
+    def __init__(self, path, job_timeout=60.0, on_usage=None):
+        # Path of the Unix socket the workers connect to
+        self.path = path
+        # Maximum number of seconds a job may take, a worker that stopped answering does not block its callers
+        self.job_timeout = job_timeout
+        # Function receiving the characters a worker sent to DeepL, called for every reply,
+        # even the ones arriving after their caller gave up
+        self.on_usage = on_usage
+        # Jobs waiting for a free worker slot
+        self.queue = asyncio.Queue()
+        # Workers currently connected
+        self.workers = []
+        self._ids = itertools.count()
+        self._server = None
+        # Tasks serving the connected workers
+        self._handlers = set()
+        # Counters exposed as metrics
+        self.completed = 0
+        self.requeued = 0
+        self.unavailable = 0
+
+    # Async method to start listening for workers, a socket left by a previous run is replaced
+    async def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_worker, self.path, limit=LINE_LIMIT)
+
+    # Async method to stop listening, the connected workers reconnect to the next broker
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            for worker in list(self.workers):
+                worker.writer.close()
+            # Closing a connection ends its handler, which gives back its jobs
+            if self._handlers:
+                await asyncio.wait(self._handlers, timeout=5)
+            await self._server.wait_closed()
+        self._fail_waiting()
+
+    # Async method to run a job in a worker, it returns the reply of the worker
+    async def translate(self, args):
+        if not self.workers:
+            self.unavailable += 1
+            raise NoWorkerError("No translation worker connected")
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((next(self._ids), args, future))
+        return await asyncio.wait_for(future, self.job_timeout)
+
+    # Internal async method serving a worker from its first message to its disconnection
+    async def _handle_worker(self, reader, writer):
+        try:
+            hello = json.loads(await reader.readline())
+        except (ValueError, ConnectionError):
+            writer.close()
+            return
+        worker = WorkerConnection(reader, writer, max(1, int(hello.get("slots", 1))))
+        self.workers.append(worker)
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        feeder = asyncio.create_task(self._feed(worker))
+        try:
+            while line := await reader.readline():
+                self._on_reply(worker, json.loads(line))
+        except (ValueError, ConnectionError):
+            # A malformed message or a broken connection, the worker is dropped
+            pass
+        finally:
+            self._handlers.discard(handler)
+            feeder.cancel()
+            self.workers.remove(worker)
+            writer.close()
+            # The unanswered jobs go back to the queue for the other workers
+            for job in worker.outstanding.values():
+                self.requeued += 1
+                self.queue.put_nowait(job)
+            if not self.workers:
+                self._fail_waiting()
+
+    # Internal async method sending jobs to a worker as long as it has free slots
+    async def _feed(self, worker):
+        while True:
+            await worker.free_slots.acquire()
+            job = await self.queue.get()
+            job_id, args, future = job
+            if future.done():
+                # The caller gave up while the job was waiting
+                worker.free_slots.release()
+                continue
+            worker.outstanding[job_id] = job
+            worker.writer.write(encode({"op": "job", "id": job_id, "args": args}))
+            await worker.writer.drain()
+
+    # Internal method resolving the job answered by a worker
+    def _on_reply(self, worker, message):
+        # DeepL billed these characters whether or not the caller still waits for the reply
+        if self.on_usage and message.get("usage"):
+            self.on_usage(message["usage"])
+        job = worker.outstanding.pop(message.get("id"), None)
+        if job is None:
+            return
+        worker.free_slots.release()
+        self.completed += 1
+        future = job[2]
+        if not future.done():
+            future.set_result(message)
+
+    # Internal method failing the waiting jobs when no worker is left, their callers translate them locally
+    def _fail_waiting(self):
+        while not self.queue.empty():
+            future = self.queue.get_nowait()[2]
+            if not future.done():
+                future.set_exception(NoWorkerError("No translation worker connected"))
+
+    # Returns the counters of the broker
+    def stats(self):
+        return {
+            "workers": len(self.workers),
+            "slots": sum(worker.slots for worker in self.workers),
+            "queued": self.queue.qsize(),
+            "outstanding": sum(len(worker.outstanding) for worker in self.workers),
+            "completed": self.completed,
+            "requeued": self.requeued,
+            "unavailable": self.unavailable,
+        }
+
+
+# Function to create the broker from the environment variables, TRANSLATION_BROKER is the path of the socket
+def from_env(on_usage=None):
+    path = os.getenv("TRANSLATION_BROKER")
+    if not path:
+        return None
+    return Broker(path, job_timeout=float(os.getenv("WORKER_JOB_TIMEOUT", "60")), on_usage=on_usage)
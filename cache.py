@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+# Function to build the cache key of a translation from its normalized text and language pair
+def make_key(text, source="", target="EN-GB", *extra):
+    # Normalize the unicode form and the surrounding whitespace, so equivalent texts share the same entry
+    normalized = unicodedata.normalize("NFC", text).strip()
+    parts = [normalized, (source or "").upper(), (target or "").upper(), *[str(part) for part in extra]]
+    # The unit separator cannot appear in a language code, so different fields never collide
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+# This class is a bounded in-memory LRU cache with a time to live and a maximum size in bytes
+class LRUCache:
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=24 * 3600):
+        # Maximum total size of the cached values
+        self.max_bytes = max_bytes
+        # Seconds after which an entry is considered stale
+        self.ttl = ttl
+        # Ordered mapping key -> (expiry, size, value), the least recently used entry comes first
+        self._entries = collections.OrderedDict()
+        # Current total size of the cached values
+        self.size = 0
+        # Counters exposed as metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the cached value or None, refreshing its position in the LRU order
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expiry, size, value = entry
+        # Stale entries are dropped as soon as they are read
+        if expiry < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    # Stores a value, evicting the least recently used entries when the size limit is exceeded
+    def set(self, key, value, size):
+        # Values larger than the whole cache are never stored
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    # Removes an entry if present, for example when the cached data becomes outdated
+    def pop(self, key):
+        if key in self._entries:
+            self._remove(key)
+
+    # Internal method to remove an entry and update the total size
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# This class stores translations in a local SQLite database, so they survive restarts
+class SQLiteStore:
+    def __init__(self, path, ttl=30 * 24 * 3600, max_rows=500_000):
+        # Seconds after which a stored translation is considered stale
+        self.ttl = ttl
+        # Maximum number of stored translations, the oldest ones are removed first, 0 means unlimited
+        self.max_rows = max_rows
+        # A single connection is shared by the worker threads, the lock serializes its usage
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            # WAL mode allows concurrent readers while writing
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, detected_source TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            # The pruning removes the rows by age
+            self._db.execute("CREATE INDEX IF NOT EXISTS translations_created ON translations (created)")
+            self._db.commit()
+
+    # Returns the stored (text, detected_source) pair or None
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, detected_source FROM translations WHERE key = ? AND created > ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    # Stores a (text, detected_source) pair
+    def set(self, key, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)", (key, *value, time.time()))
+            self._db.commit()
+
+    # Removes the stale translations from the database, then the oldest ones above max_rows.
+    # It returns the number of removed rows
+    def prune(self):
+        with self._lock:
+            removed = self._db.execute("DELETE FROM translations WHERE created <= ?",
+                                       (time.time() - self.ttl,)).rowcount
+            if self.max_rows:
+                extra = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.max_rows
+                if extra > 0:
+                    removed += self._db.execute(
+                        "DELETE FROM translations WHERE key IN "
+                        "(SELECT key FROM translations ORDER BY created LIMIT ?)", (extra,)
+                    ).rowcount
+            self._db.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# This class combines the in-memory LRU with the persistent store, the disk is only read on a memory miss
+class TranslationCache:
+    def __init__(self, path=None, max_bytes=16 * 1024 * 1024, ttl=24 * 3600, disk_ttl=30 * 24 * 3600,
+                 disk_max_rows=500_000):
+        # First tier, fast and bounded
+        self.memory = LRUCache(max_bytes=max_bytes, ttl=ttl)
+        # Second tier, optional and persistent, bounded by the periodic prune()
+        self.disk = SQLiteStore(path, ttl=disk_ttl, max_rows=disk_max_rows) if path else None
+        # Number of lookups answered by the persistent store
+        self.disk_hits = 0
+        # Number of rows removed from the persistent store
+        self.disk_pruned = 0
+        # Prune the stale rows once at startup
+        if self.disk:
+            self.disk.prune()
+
+    # Async method returning the cached (text, detected_source) pair or None
+    async def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        # SQLite calls run in a worker thread so the event loop is never blocked
+        value = await asyncio.to_thread(self.disk.get, key)
+        if value is not None:
+            self.disk_hits += 1
+            # Promote the entry to the memory tier
+            self.memory.set(key, value, _size_of(value))
+        return value
+
+    # Async method to store a (text, detected_source) pair in both tiers
+    async def set(self, key, value):
+        self.memory.set(key, value, _size_of(value))
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    # Async method removing the stale and the oldest translations of the persistent store, the bot calls it
+    # periodically. It returns the number of removed rows
+    async def prune(self):
+        if self.disk is None:
+            return 0
+        removed = await asyncio.to_thread(self.disk.prune)
+        self.disk_pruned += removed
+        return removed
+
+    # Returns the counters of the cache
+    def stats(self):
+        return {
+            "hits": self.memory.hits + self.disk_hits,
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.memory.misses - self.disk_hits,
+            "evictions": self.memory.evictions,
+            "entries": len(self.memory),
+            "bytes": self.memory.size,
+            "max_bytes": self.memory.max_bytes,
+            "disk_pruned": self.disk_pruned,
+        }
+
+    def close(self):
+        if self.disk:
+            self.disk.close()
+
+
+# Internal function to estimate the memory used by a cached (text, detected_source) pair
+def _size_of(value):
+    return sum(len(part.encode("utf-8")) for part in value)
+
+
+# Function to create the translation cache from the environment variables
+def from_env():
+    return TranslationCache(
+        path=os.getenv("CACHE_PATH", "translation_cache.db") or None,
+        max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+        ttl=float(os.getenv("CACHE_TTL", str(24 * 3600))),
+        disk_max_rows=int(os.getenv("CACHE_DISK_MAX_ROWS", "500000")),
+    )
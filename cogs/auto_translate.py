@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import re
+import discord
+from discord.ext import commands
+from discord import app_commands
+from translation import translation, get_registry
+from languages import base_code
+from storage import JsonStore
+from job_queue import REACTION, QueueFullError
+import metrics
+import hot_reload
+
+# Auto-translated channels, channel id -> {"target": language code, "mirror": channel id or None}
+AUTO_TRANSLATE = JsonStore(os.getenv("AUTO_TRANSLATE_PATH", "auto_translate.json"))
+# Seconds the messages of a channel are collected before being translated together
+FLUSH_DELAY = float(os.getenv("AUTO_TRANSLATE_DELAY", "5"))
+# Number of collected messages that triggers the translation without waiting for the delay
+MAX_BATCH = int(os.getenv("AUTO_TRANSLATE_MAX_BATCH", "20"))
+# Minimum number of letters of a message to be translated, shorter ones and emoji-only ones are skipped
+MIN_LETTERS = int(os.getenv("AUTO_TRANSLATE_MIN_LETTERS", "4"))
+# Maximum length of the description of the rolling mirror embed
+MIRROR_LENGTH = 4000
+# Maximum length of a single translated line in the mirror
+LINE_LENGTH = 1000
+
+# Custom emojis, mentions and links do not count as text to translate
+_NOT_TEXT = re.compile(r"<a?:\w+:\d+>|<[@#][!&]?\d+>|https?://\S+")
+
+
+# Function to check whether a message has enough text to be worth translating
+def is_translatable(content):
+    return sum(character.isalpha() for character in _NOT_TEXT.sub("", content)) >= MIN_LETTERS
+
+
+# This class is a Discord.py Cog mirroring the messages of some channels in another language
+class AutoTranslate(commands.Cog):
+    def __init__(self, bot):
+        # Reference to the bot instance
+        self.bot = bot
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # After a hot reload the cog continues from the state of its previous instance
+        state = hot_reload.take_state(bot, self.qualified_name)
+        # Messages waiting to be translated, channel id -> list of (author name, author id, content)
+        self.buffers = state.get("buffers", {})
+        # Pending flushes, channel id -> task
+        self.flush_tasks = state.get("flush_tasks", {})
+        # Last mirror message of each channel and its description, updated until it is full
+        self.mirrors = state.get("mirrors", {})
+        # Locks serializing the updates of the mirror message of each channel, channel id -> lock
+        self.mirror_locks = state.get("mirror_locks", {})
+        # True once the state was handed over to a new instance of the cog
+        self.handed_over = False
+
+    # Method called by the bot before a hot reload. The pending flushes keep running and read the same buffers,
+    # so the messages collected before the reload are translated as usual
+    def export_state(self):
+        self.handed_over = True
+        return {"buffers": self.buffers, "flush_tasks": self.flush_tasks, "mirrors": self.mirrors,
+                "mirror_locks": self.mirror_locks}
+
+    # Method called when the cog is unloaded, the pending flushes are cancelled unless a new instance takes them over
+    async def cog_unload(self) -> None:
+        if self.handed_over:
+            return
+        for task in self.flush_tasks.values():
+            task.cancel()
+
+    # This method is called for every message, only the ones of auto-translated channels are collected
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        settings = AUTO_TRANSLATE.get(message.channel.id)
+        if settings is None or message.author.bot or not is_translatable(message.content):
+            return
+        buffer = self.buffers.setdefault(message.channel.id, [])
+        buffer.append((message.author.display_name, message.author.id, message.content))
+        if len(buffer) >= MAX_BATCH:
+            # The batch is full, it is translated right away
+            task = self.flush_tasks.pop(message.channel.id, None)
+            if task:
+                task.cancel()
+            self._schedule_flush(message.channel, 0)
+        elif message.channel.id not in self.flush_tasks:
+            self._schedule_flush(message.channel, FLUSH_DELAY)
+
+    # Internal method to start the task that translates the collected messages of a channel after a delay
+    def _schedule_flush(self, channel, delay):
+        task = asyncio.create_task(self._flush(channel, delay))
+        self.flush_tasks[channel.id] = task
+
+    # Internal async method translating the collected messages of a channel through the bot's job queue
+    async def _flush(self, channel, delay):
+        await asyncio.sleep(delay)
+        # From now on the new messages start another batch
+        self.flush_tasks.pop(channel.id, None)
+        entries = self.buffers.pop(channel.id, [])
+        settings = AUTO_TRANSLATE.get(channel.id)
+        if not entries or settings is None:
+            return
+        try:
+            await self.bot.jobs.submit(lambda: self.translate_and_mirror(channel, settings, entries), REACTION)
+        except QueueFullError:
+            self.logger.warning(f"Dropped {len(entries)} messages of channel {channel.id}, the queue is full")
+        except Exception as e:
+            self.logger.error(f"Auto-translation of channel {channel.id} failed: {e}")
+
+    # Async method to translate a batch of messages and add them to the rolling mirror message
+    async def translate_and_mirror(self, channel, settings, entries):
+        target = settings["target"]
+        # The messages are requested concurrently, so the batcher sends them to DeepL in a single request
+        results = await asyncio.gather(*(translation(content, target=target, guild_id=channel.guild.id,
+                                                     channel_id=channel.id, user_id=author_id)
+                                         for _, author_id, content in entries), return_exceptions=True)
+        lines = []
+        for (author, _, content), result in zip(entries, results):
+            if isinstance(result, Exception):
+                continue
+            text, detected = result
+            # Messages already in the target language are not mirrored
+            if text == content and base_code(detected) == base_code(target):
+                continue
+            lines.append(f"**{discord.utils.escape_markdown(author)}**: {text}"[:LINE_LENGTH])
+        if lines:
+            destination = self.bot.get_channel(settings.get("mirror") or channel.id) or channel
+            with metrics.SEND_LATENCY.time("auto_translate"):
+                await self.update_mirror(channel.id, destination, target, lines)
+
+    # Async method to append lines to the mirror message of a channel, a new message is started when it is full.
+    # Two batches of the same channel can be sent by different workers, they update the mirror one after the other
+    async def update_mirror(self, channel_id, destination, target, lines):
+        async with self.mirror_locks.setdefault(channel_id, asyncio.Lock()):
+            message, description = self.mirrors.get(channel_id, (None, ""))
+            changed = False
+            for line in lines:
+                if message and len(description) + len(line) + 1 <= MIRROR_LENGTH:
+                    description = f"{description}\n{line}"
+                    changed = True
+                    continue
+                # The current mirror message is full, or there is none yet
+                if changed:
+                    message = await self._edit_or_send(message, destination, target, description)
+                description = line
+                message = await destination.send(embed=self.build_mirror_embed(target, description))
+                changed = False
+            if changed:
+                message = await self._edit_or_send(message, destination, target, description)
+            self.mirrors[channel_id] = (message, description)
+
+    # Internal async method to update a mirror message, sending a new one if it was deleted
+    async def _edit_or_send(self, message, destination, target, description):
+        embed = self.build_mirror_embed(target, description)
+        try:
+            return await message.edit(embed=embed)
+        except discord.NotFound:
+            return await destination.send(embed=embed)
+
+    # Method to build the embed of a mirror message
+    def build_mirror_embed(self, target, description):
+        embed = discord.Embed(title=f"Auto-translation to {get_registry().target_name(target)}",
+                              color=discord.Color.blue(), description=description)
+        embed.set_footer(text="Powered by Marsik24 \nSome languages may not be supported.")
+        return embed
+
+    # Enables or disables the automatic translation of the channel where the command is used
+    @app_commands.command(name="auto_translate", description="automatically translate the messages of this channel")
+    @app_commands.describe(target="language code or name to translate to, empty to disable",
+                           mirror="channel where the translations are posted, this one if omitted")
+    @app_commands.default_permissions(manage_channels=True)
+    @app_commands.guild_only()
+    async def auto_translate(self, interaction: discord.Interaction, target: str = None,
+                             mirror: discord.TextChannel = None):
+        registry = get_registry()
+        if not target:
+            await AUTO_TRANSLATE.delete(interaction.channel_id)
+            self.mirrors.pop(interaction.channel_id, None)
+            await interaction.response.send_message("Auto-translation disabled in this channel.", ephemeral=True)
+            return
+        code = target.upper() if registry.is_target(target) else registry.target_code(target)
+        if code is None:
+            await interaction.response.send_message(f"Unknown language: {target}", ephemeral=True)
+            return
+        await AUTO_TRANSLATE.set(interaction.channel_id, {"target": code, "mirror": mirror.id if mirror else None})
+        self.mirrors.pop(interaction.channel_id, None)
+        where = mirror.mention if mirror else "this channel"
+        await interaction.response.send_message(
+            f"Messages of this channel will be translated to {registry.target_name(code)} in {where}.", ephemeral=True)
+
+
+# Function required by discord.py to load a Cog
+async def setup(bot):
+    await bot.add_cog(AutoTranslate(bot))
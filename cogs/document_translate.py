@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import tempfile
+import traceback
+import discord
+from discord.ext import commands
+from discord import app_commands
+import translation
+from translation import get_registry, DOCUMENT_TYPES, DOCUMENT_MAX_BYTES, DOCUMENT_CHUNK_SIZE, DocumentTooLargeError
+from resilience import CircuitOpenError
+from quota import QuotaExceededError
+from cogs.translator_command import PagedLanguageView
+import metrics
+import hot_reload
+
+# Maximum number of documents translated at the same time, each one can keep DeepL busy for minutes
+DOCUMENT_CONCURRENCY = int(os.getenv("DOCUMENT_CONCURRENCY", "4"))
+# Size of a translated document kept in memory, larger ones are spooled to a temporary file
+SPOOL_SIZE = 1024 * 1024
+# Size of the files the bot can upload outside of guilds
+DEFAULT_UPLOAD_LIMIT = 10 * 1024 * 1024
+
+
+# Function returning the extension of a file name, lowercase and without the dot
+def file_extension(filename):
+    return os.path.splitext(filename)[1].lstrip(".").lower()
+
+
+# This class is a Discord.py Cog translating the files attached to messages through the DeepL document API
+class DocumentTranslate(commands.Cog):
+    def __init__(self, bot):
+        # Reference to the bot instance
+        self.bot = bot
+        # Configure the logger for this instance of the cog
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # Limits the documents in translation, they are not run by the job queue to keep its workers free.
+        # The limit is shared with the documents still in translation by the previous instance after a hot reload
+        state = hot_reload.take_state(bot, self.qualified_name)
+        self.slots = state.get("slots", asyncio.Semaphore(DOCUMENT_CONCURRENCY))
+
+    # Method called by the bot before a hot reload, the new instance of the cog continues from this state
+    def export_state(self):
+        return {"slots": self.slots}
+
+    # Method returning why an attachment cannot be translated, or None
+    def check_attachment(self, attachment: discord.Attachment):
+        if file_extension(attachment.filename) not in DOCUMENT_TYPES:
+            return f"Unsupported file type, the supported ones are: {', '.join(sorted(DOCUMENT_TYPES))}."
+        if attachment.size > DOCUMENT_MAX_BYTES:
+            return f"The file is too large, the limit is {DOCUMENT_MAX_BYTES / 1024 / 1024:.1f} MB."
+        return None
+
+    # Async method to ask the target language of an already deferred interaction
+    async def prompt_target(self, interaction: discord.Interaction):
+        target_lang_view = PagedLanguageView(get_registry().target_pages, is_from=False)
+        target_lang_code = await target_lang_view.prompt(interaction)
+        if target_lang_code is None:
+            await interaction.followup.send("Destination language selection cancelled or expired.", ephemeral=True)
+        return target_lang_code
+
+    # Async method to translate an attachment and send back the translated file,
+    # the file is streamed from Discord to DeepL and from DeepL to a temporary file
+    async def translate_attachment(self, interaction: discord.Interaction, attachment: discord.Attachment,
+                                   target_lang_code: str, source_lang_code: str = ""):
+        # The translated file must fit in the upload limit of the guild
+        upload_limit = interaction.guild.filesize_limit if interaction.guild else DEFAULT_UPLOAD_LIMIT
+        async with self.slots:
+            try:
+                problem = await translation.check_document_usage()
+                if problem:
+                    await interaction.followup.send(problem, ephemeral=True)
+                    return
+                async with self.bot.client.get(attachment.url) as download:
+                    download.raise_for_status()
+                    document = await translation.start_document_translation(
+                        download.content.iter_chunked(DOCUMENT_CHUNK_SIZE), attachment.filename,
+                        source=source_lang_code, target=target_lang_code, guild_id=interaction.guild_id)
+                with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as output:
+                    billed_characters = await translation.finish_document_translation(
+                        document, output, source=source_lang_code, target=target_lang_code,
+                        guild_id=interaction.guild_id, channel_id=interaction.channel_id, user_id=interaction.user.id,
+                        max_bytes=upload_limit)
+                    output.seek(0)
+                    stem, extension = os.path.splitext(attachment.filename)
+                    translated_file = discord.File(output, filename=f"{stem}_{target_lang_code}{extension}")
+                    with metrics.SEND_LATENCY.time("document"):
+                        await interaction.followup.send(
+                            f"Translated to {get_registry().target_name(target_lang_code)}, "
+                            f"{billed_characters} characters billed.", file=translated_file)
+            except (CircuitOpenError, QuotaExceededError, DocumentTooLargeError) as e:
+                await interaction.followup.send(f"{e}.", ephemeral=True)
+            except Exception as e:
+                self.logger.error(f"Error during document translation: {e}\n{traceback.format_exc()}")
+                await interaction.followup.send(f"An error occurred during translation: {e}", ephemeral=True)
+
+    # Translates a file, the source language is automatically detected
+    @app_commands.command(name="translate_document", description="translate a document (docx, pptx, pdf, txt...)")
+    @app_commands.describe(file="the document to translate")
+    async def translate_document(self, interaction: discord.Interaction, file: discord.Attachment):
+        # Set the interaction to “loading” (ephemeral = visible only to the user)
+        await interaction.response.defer(ephemeral=True)
+        problem = self.check_attachment(file)
+        if problem:
+            await interaction.followup.send(problem, ephemeral=True)
+            return
+        target_lang_code = await self.prompt_target(interaction)
+        if target_lang_code is None:
+            return
+        await self.translate_attachment(interaction, file, target_lang_code)
+
+
+# Function required by discord.py to load a Cog
+async def setup(bot):
+    await bot.add_cog(DocumentTranslate(bot))
+    bot.tree.add_command(translate_document_context)
+
+
+# Function called by discord.py when the extension is unloaded, the context menu is registered again by the next setup
+async def teardown(bot):
+    bot.tree.remove_command(translate_document_context.name, type=translate_document_context.type)
+
+
+# This command appears when a user right-clicks on a message, it translates the first supported file attached to it
+@app_commands.context_menu(name="Translate Document")
+async def translate_document_context(interaction: discord.Interaction, message: discord.Message):
+    # Obtains the Cog DocumentTranslate instance from the bot
+    document_cog = interaction.client.get_cog("DocumentTranslate")
+    if document_cog is None:
+        await interaction.response.send_message("Document translation is not available.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    attachments = [attachment for attachment in message.attachments
+                   if file_extension(attachment.filename) in DOCUMENT_TYPES]
+    if not attachments:
+        await interaction.followup.send("This message has no document to translate.", ephemeral=True)
+        return
+    problem = document_cog.check_attachment(attachments[0])
+    if problem:
+        await interaction.followup.send(problem, ephemeral=True)
+        return
+    target_lang_code = await document_cog.prompt_target(interaction)
+    if target_lang_code is None:
+        return
+    await document_cog.translate_attachment(interaction, attachments[0], target_lang_code)
@@ -0,0 +1,113 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import translation
+from glossary import GlossaryError, pair
+from languages import base_code, normalize
+
+# Maximum length of an embed field value
+FIELD_LIMIT = 1024
+
+
+# Function to read a source language given as code or name, it returns its code or None
+def parse_source(value):
+    registry = translation.get_registry()
+    return normalize(value) if normalize(value) in registry.source_codes else registry.source_code(value)
+
+
+# Function to read a target language given as code or name, it returns its code or None.
+# Glossaries apply to all the variants of a language, so "EN" is accepted as well as "EN-GB"
+def parse_target(value):
+    registry = translation.get_registry()
+    code = registry.target_code(value) or normalize(value)
+    if any(base_code(target) == base_code(code) for target in registry.target.values()):
+        return code
+    return None
+
+
+# This class is a Discord.py Cog managing the glossaries of a server, applied automatically to its translations
+@app_commands.default_permissions(manage_guild=True)
+@app_commands.guild_only()
+class GlossaryCommand(commands.GroupCog, group_name="glossary",
+                      group_description="manage the glossaries of this server"):
+    def __init__(self, bot):
+        # Reference to the bot instance
+        self.bot = bot
+
+    # Method to change a glossary and sync it with DeepL, it returns the message for the user
+    async def update(self, interaction, source, target, changes):
+        source_code, target_code = parse_source(source), parse_target(target)
+        if source_code is None or target_code is None:
+            return f"Unknown language: {source if source_code is None else target}"
+        try:
+            key = await translation.glossaries.update(interaction.guild_id, source_code, target_code, changes)
+        except GlossaryError as e:
+            return str(e)
+        try:
+            await translation.sync_glossary(interaction.guild_id, key)
+        except Exception as e:
+            # The change is kept and synced again when the bot starts
+            return f"Glossary {key} saved, but not yet active: {e}"
+        return None
+
+    # Adds a term to the glossary of a language pair, or changes its translation
+    @app_commands.command(name="add", description="add a term to the glossary of a language pair")
+    @app_commands.describe(source="language of the term, code or name", target="language of the translation",
+                           term="term to translate", translation="translation that DeepL must use")
+    async def add(self, interaction: discord.Interaction, source: str, target: str, term: str, translation: str):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        error = await self.update(interaction, source, target, {term.strip(): translation.strip()})
+        await interaction.followup.send(error or f"**{term.strip()}** is now translated as **{translation.strip()}**.",
+                                        ephemeral=True)
+
+    # Removes a term from the glossary of a language pair
+    @app_commands.command(name="remove", description="remove a term from the glossary of a language pair")
+    @app_commands.describe(source="language of the term, code or name", target="language of the translation",
+                           term="term to remove")
+    async def remove(self, interaction: discord.Interaction, source: str, target: str, term: str):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        error = await self.update(interaction, source, target, {term.strip(): None})
+        await interaction.followup.send(error or f"**{term.strip()}** removed from the glossary.", ephemeral=True)
+
+    # Removes all the terms of the glossary of a language pair
+    @app_commands.command(name="clear", description="remove the glossary of a language pair")
+    @app_commands.describe(source="language of the terms, code or name", target="language of the translations")
+    async def clear(self, interaction: discord.Interaction, source: str, target: str):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        source_code, target_code = parse_source(source), parse_target(target)
+        current = {}
+        if source_code and target_code:
+            current = (translation.glossaries.get(interaction.guild_id, pair(source_code, target_code)) or {})
+        error = await self.update(interaction, source, target, dict.fromkeys(current.get("entries", {})))
+        await interaction.followup.send(error or "Glossary removed.", ephemeral=True)
+
+    # Shows the glossaries of this server
+    @app_commands.command(name="list", description="show the glossaries of this server")
+    async def list_glossaries(self, interaction: discord.Interaction):
+        await interaction.response.send_message(embed=self.build_glossary_embed(interaction.guild_id), ephemeral=True)
+
+    # Method to build the embed with the glossaries of a guild, one field for each language pair
+    def build_glossary_embed(self, guild_id):
+        embed = discord.Embed(title="Glossaries", color=discord.Color.blue())
+        glossaries = translation.glossaries.glossaries(guild_id)
+        if not glossaries:
+            embed.description = "This server has no glossary, add terms with /glossary add."
+        for key, glossary in list(glossaries.items())[:25]:
+            lines = [f"{term} → {value}" for term, value in sorted(glossary["entries"].items())]
+            value = ""
+            for i, line in enumerate(lines):
+                more = f"\n… and {len(lines) - i} more"
+                if len(value) + len(line) + 1 + len(more) > FIELD_LIMIT:
+                    value += more
+                    break
+                value += f"\n{line}"
+            state = "active" if glossary["synced_version"] == glossary["version"] else "waiting for sync"
+            embed.add_field(name=f"{key.replace('-', ' → ')} ({len(lines)} terms, {state})",
+                            value=value.strip() or "-", inline=False)
+        embed.set_footer(text="Powered by Marsik24 \nGlossaries apply when the source language is known.")
+        return embed
+
+
+# Function required by discord.py to load a Cog
+async def setup(bot):
+    await bot.add_cog(GlossaryCommand(bot))
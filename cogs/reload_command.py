@@ -0,0 +1,58 @@
+import os
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+# Number of automatic reloads shown by the command
+HISTORY_SIZE = 5
+
+
+# This class is a Discord.py Cog letting the owner of the bot apply new code and flags without restarting it
+class ReloadCommand(commands.Cog):
+    def __init__(self, bot):
+        # Reference to the bot instance
+        self.bot = bot
+
+    # Method to build the embed with the result of a reload and the last reloads done by the file watcher
+    def build_reload_embed(self, report, history):
+        failed = [item for item in report if item["error"]]
+        embed = discord.Embed(title="Reload", color=discord.Color.red() if failed else discord.Color.green(),
+                              description="\n".join(self.format_item(item) for item in report) or "Nothing to reload.")
+        if history:
+            embed.add_field(name="Recent reloads", inline=False, value="\n".join(
+                f"{discord.utils.format_dt(item['time'], 'R')} {self.format_item(item)}" for item in history))
+        total = sum(item["seconds"] for item in report)
+        embed.set_footer(text=f"Powered by Marsik24 \nReloaded in {total * 1000:.1f} ms without reconnecting.")
+        return embed
+
+    # Method to describe a reloaded item with its latency
+    def format_item(self, item):
+        line = f"`{item['name']}` {item['action']} in {item['seconds'] * 1000:.1f} ms"
+        return f"{line}: {item['error'][:200]}" if item["error"] else line
+
+    # Reloads an extension, or all the extensions and the flags, and reports the latency of each one
+    @app_commands.command(name="reload", description="reload the extensions and the flags without restarting the bot")
+    @app_commands.describe(extension="name of the extension to reload, all of them and the flags if omitted")
+    @app_commands.default_permissions(administrator=True)
+    async def reload(self, interaction: discord.Interaction, extension: str = None):
+        # The reload affects every server, only the owner of the bot can start it
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("Only the owner of the bot can reload it.", ephemeral=True)
+            return
+        paths = None
+        if extension:
+            path = os.path.join(self.bot.ext_dir, f"{extension}.py")
+            if not extension.isidentifier() or (f"{self.bot.ext_dir}.{extension}" not in self.bot.extensions
+                                                and not os.path.isfile(path)):
+                await interaction.response.send_message(f"Unknown extension: {extension}", ephemeral=True)
+                return
+            paths = [path]
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        history = list(self.bot.reload_history)[-HISTORY_SIZE:]
+        report = await self.bot.hot_reload(paths)
+        await interaction.followup.send(embed=self.build_reload_embed(report, history), ephemeral=True)
+
+
+# Function required by discord.py to load a Cog
+async def setup(bot):
+    await bot.add_cog(ReloadCommand(bot))
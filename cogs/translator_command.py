@@ -1,84 +1,166 @@
+import asyncio
+import collections
+import logging
+import os
+import traceback
 import discord
 from discord.ext import commands
 from discord import app_commands, ui
-from translation import translation, get_source_language, get_target_language, get_flag
+from translation import translation, get_registry, get_flags, split_text, SingleFlight
+from cache import LRUCache
+from storage import JsonStore
+from languages import base_code
+from resilience import CircuitOpenError
+from quota import QuotaExceededError
+import metrics
+import hot_reload
+from job_queue import INTERACTION, REACTION, QueueFullError, DeadlineExceededError
 import datetime
-
-# Global dictionary for source languages
-SOURCE_DICT = get_source_language()
-# Global dictionary for target languages
-TARGET_DICT = get_target_language()
-# Global dictionary for translations via reactions
-EMOJI_TO_LANGUAGE = get_flag()
-
-
-# This class defines a UI with a single button to send the translation in DM to the user who requested it
-class SendPrivateButton(ui.View):
-    def __init__(self, original_text: str, text_to_send: str, author: str):
-        # Initialize the view, setting a timeout of 3 minutes
-        super().__init__(timeout=180)
-        # The original text that was translated
-        self.original_text = original_text
-        # The translated text to be sent
-        self.text_to_send = text_to_send
-        # The user object that requested the translation
-        self.author = author
-        # Adds a button labeled “Send to DM”
-        self.add_item(discord.ui.Button(label="Send to DM", style=discord.ButtonStyle.primary))
-        # Assigns the `send_private_message` callback to the added button
-        self.children[0].callback = self.send_private_message
-        # Reference to the message in which the view was sent, used to disable buttons at timeout
-        self.message = None
-
-    # Method called when view reaches timeout
-    async def on_timeout(self) -> None:
-        for item in self.children:
-            item.disabled = True
-        await self.message.edit(view=self)
+import time
+
+# Maximum size in bytes and lifetime of the contents of the messages fetched for flag translations
+REACTED_MESSAGE_CACHE_BYTES = int(os.getenv("REACTED_MESSAGE_CACHE_BYTES", str(2 * 1024 * 1024)))
+REACTED_MESSAGE_CACHE_TTL = float(os.getenv("REACTED_MESSAGE_CACHE_TTL", "600"))
+# Maximum length of an embed field value
+FIELD_LENGTH = 1024
+# Maximum number of requesters mentioned in a translation, a burst of reactions only mentions the first ones
+MAX_MENTIONS = int(os.getenv("MAX_MENTIONS", "10"))
+# Maximum length of the segments long texts are split into, below the field limit since translations can be longer
+SEGMENT_LENGTH = int(os.getenv("SEGMENT_LENGTH", "900"))
+# Reaction translating the message to all the languages of the guild preset
+MULTI_TRANSLATE_EMOJI = os.getenv("MULTI_TRANSLATE_EMOJI", "\U0001F310")
+# Maximum number of target languages of a multi-target translation
+MAX_TARGETS = 10
+# Languages of the multi-target translation in the guilds without a preset, comma-separated codes
+DEFAULT_PRESET = [code for code in os.getenv("DEFAULT_PRESET", "").split(",") if code]
+# Target languages of the multi-target translation chosen by each guild, guild id -> list of codes
+GUILD_PRESETS = JsonStore(os.getenv("GUILD_PRESETS_PATH", "guild_presets.json"))
+# Maximum length of the custom_id of a component
+CUSTOM_ID_LENGTH = 100
+# Maximum number of paginated results whose buttons work at the same time, the oldest ones are closed first
+MAX_LIVE_VIEWS = int(os.getenv("MAX_LIVE_VIEWS", "500"))
+# Time within which the followup of an interaction must be sent
+INTERACTION_LIFETIME = datetime.timedelta(minutes=15)
+
+
+# Lightweight copy of a reacted message, it keeps only what the flag translation needs
+class ReactedMessage:
+    __slots__ = ("id", "content", "channel", "guild")
+
+    def __init__(self, message_id, content, channel, guild_id):
+        self.id = message_id
+        self.content = content
+        # Partial channel, it can send messages without being in the cache
+        self.channel = channel
+        self.guild = discord.Object(guild_id) if guild_id else None
+
+
+# This class is a persistent "Send to DM" button, it keeps no state: the users allowed to press it are encoded
+# in its custom_id and the translation is read back from the embed of the message when it is pressed
+class SendPrivateButton(ui.DynamicItem[ui.Button], template=r"translator:dm:(?P<user_ids>\d+(?:\.\d+)*)"):
+    def __init__(self, user_ids):
+        # Ids of the users who requested the translation, as many as fit in the custom_id
+        self.user_ids = []
+        custom_id = "translator:dm:"
+        for user_id in map(str, user_ids):
+            if len(custom_id) + len(user_id) + bool(self.user_ids) > CUSTOM_ID_LENGTH:
+                break
+            custom_id += ("." if self.user_ids else "") + user_id
+            self.user_ids.append(user_id)
+        super().__init__(ui.Button(label="Send to DM", style=discord.ButtonStyle.primary, custom_id=custom_id))
+
+    # Method called by discord.py to rebuild the button from the custom_id of a pressed button
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: ui.Button, match):
+        return cls(match["user_ids"].split("."))
 
     # Callback method for the “Send to DM” button
-    async def send_private_message(self, interaction: discord.Interaction):
-        # Checks whether the interaction is from the user who requested the translation
-        if interaction.user == self.author:
-            try:
-                # Create an embed with the title, color and description
-                embed = discord.Embed(
-                    title="Your Translation",
-                    color=discord.Color.blue(),
-                    description=f"Here's the translated text you requested:"
-                )
-                # Adds fields for original text and translated text
-                embed.add_field(name="Original Text", value=self.original_text, inline=False)
-                embed.add_field(name="Translated", value=self.text_to_send, inline=False)
-                # Set the footer and timestamp of the embed.
-                embed.set_footer(text="Powered by Marsik24 \nSome languages may not be supported.")
-                embed.timestamp = datetime.datetime.now()
-                # Attempt to send embed in DM to author
-                await self.author.send(embed=embed)
-            # Responds to interaction (on channel) informing that DM has been sent|
-            except discord.errors.Forbidden:
-                await interaction.response.send_message(
-                    "I couldn't send you a DM. Please make sure your DMs are open.", ephemeral=True)
-                # Handles the error if the bot fails to send a DM
-            except Exception as e:
-                await interaction.response.send_message(f"An error occurred while sending the DM: {e}", ephemeral=True)
-        else:
-            # If a different user tries to click the button
+    async def callback(self, interaction: discord.Interaction):
+        # Checks whether the interaction is from a user who requested the translation
+        if str(interaction.user.id) not in self.user_ids:
             await interaction.response.send_message(
                 "This button is only for the user who requested the translation.", ephemeral=True)
+            return
+        if not interaction.message.embeds:
+            await interaction.response.send_message("This translation is not available anymore.", ephemeral=True)
+            return
+        try:
+            # Create an embed with the title, color and description
+            embed = discord.Embed(
+                title="Your Translation",
+                color=discord.Color.blue(),
+                description=f"Here's the translated text you requested:"
+            )
+            # Copy the fields with the original text and the translated text from the result message
+            for field in interaction.message.embeds[0].fields:
+                embed.add_field(name=field.name, value=field.value, inline=False)
+            # Set the footer and timestamp of the embed.
+            embed.set_footer(text="Powered by Marsik24 \nSome languages may not be supported.")
+            embed.timestamp = datetime.datetime.now()
+            # Attempt to send embed in DM to the user
+            await interaction.user.send(embed=embed)
+            # Responds to interaction (on channel) informing that DM has been sent
+            await interaction.response.send_message("The translation has been sent to your DMs.", ephemeral=True)
+        except discord.errors.Forbidden:
+            # Handles the error if the bot fails to send a DM
+            await interaction.response.send_message(
+                "I couldn't send you a DM. Please make sure your DMs are open.", ephemeral=True)
+        except Exception as e:
+            await interaction.response.send_message(f"An error occurred while sending the DM: {e}", ephemeral=True)
+
+
+# Function to build the view of a translation result, the view is not kept in memory:
+# the clicks are routed to SendPrivateButton by its custom_id, even after a restart
+def private_button_view(user_ids):
+    view = ui.View(timeout=None)
+    view.add_item(SendPrivateButton(user_ids))
+    # A finished view is sent without being stored by discord.py
+    view.stop()
+    return view
+
+
+# This class keeps track of the views waiting for clicks, the oldest ones are closed when there are too many
+class LiveViews:
+    def __init__(self, max_views):
+        # Maximum number of views alive at the same time
+        self.max_views = max_views
+        # Mapping view -> approximate size in bytes of the content it holds, oldest first
+        self.views = collections.OrderedDict()
+        self.bytes = 0
+        # Number of views closed before their timeout to respect the limit
+        self.closed = 0
+
+    # Adds a view, closing the oldest ones if the limit is exceeded
+    def add(self, view, size):
+        self.views[view] = size
+        self.bytes += size
+        while len(self.views) > self.max_views:
+            oldest = next(iter(self.views))
+            self.discard(oldest)
+            self.closed += 1
+            asyncio.ensure_future(oldest.close())
+
+    # Forgets a view that timed out or was closed
+    def discard(self, view):
+        self.bytes -= self.views.pop(view, 0)
+
+    # Returns the counters of the live views
+    def stats(self):
+        return {
+            "views": len(self.views),
+            "bytes": self.bytes,
+            "max_views": self.max_views,
+            "closed": self.closed,
+        }
 
 
 # This class creates a view with a drop-down menu for language selection supporting pagination
 class PagedLanguageView(ui.View):
-    def __init__(self, language_codes, language_names, is_from=True):
+    def __init__(self, pages, is_from=True):
         # 1 minute timeout for language selection
         super().__init__(timeout=60)
-        # List of language codes
-        self.language_codes = language_codes
-        # List of language names
-        self.language_names = language_names
-        # Number of options per page in the drop-down menu
-        self.page_size = 25
+        # Select menu options of each page, precomputed by the language registry
+        self.pages = pages
         # Current page displayed
         self.current_page = 0
         # True if selecting the source language, False for the target language
@@ -92,14 +174,9 @@ class PagedLanguageView(ui.View):
 
     # Internal method to obtain the select menu options for the current page
     def _get_current_page_options(self):
-        start = self.current_page * self.page_size
-        end = min((self.current_page + 1) * self.page_size, len(self.language_codes))
-        options = []
-        # Builds the options for the select menu
-        for i in range(start, end):
-            if i < len(self.language_codes) and i < len(self.language_names):
-                options.append(discord.SelectOption(label=self.language_names[i], value=self.language_codes[i]))
-        return options
+        if self.current_page < len(self.pages):
+            return list(self.pages[self.current_page])
+        return []
 
     # Internal method for updating the drop-down menus and buttons of the view
     def _update_view(self):
@@ -147,7 +224,7 @@ class PagedLanguageView(ui.View):
             self.add_item(prev_button)
 
         # Adds the “Next Page” button if there are other pages available
-        if (self.current_page + 1) * self.page_size < len(self.language_codes):
+        if self.current_page + 1 < len(self.pages):
             next_button = ui.Button(label="Next Page", style=discord.ButtonStyle.primary)
 
             # Defines the callback for the “Next Page” button
@@ -175,84 +252,364 @@ class PagedLanguageView(ui.View):
         return self.selected_language_code
 
 
+# This class shows a list of embeds one at a time in a single message, with buttons to move between them
+class PagedResultView(ui.View):
+    def __init__(self, embeds, live_views=None):
+        # Initialize the view, setting a timeout of 3 minutes
+        super().__init__(timeout=180)
+        # The embeds of the pages, one per target language and part of the text
+        self.embeds = embeds
+        # Current page displayed
+        self.current_page = 0
+        # Reference to the message in which the view was sent, used to disable buttons at timeout
+        self.message = None
+        # Registry of the live views the view is removed from when it is closed
+        self.live_views = live_views
+        self.prev_button = ui.Button(label="Prev Page", style=discord.ButtonStyle.primary)
+        self.prev_button.callback = self.prev_callback
+        # Disabled button showing the current page number
+        self.page_button = ui.Button(style=discord.ButtonStyle.secondary, disabled=True)
+        self.next_button = ui.Button(label="Next Page", style=discord.ButtonStyle.primary)
+        self.next_button.callback = self.next_callback
+        for button in (self.prev_button, self.page_button, self.next_button):
+            self.add_item(button)
+        self._update_buttons()
+
+    # Internal method to update the label and the state of the buttons for the current page
+    def _update_buttons(self):
+        self.page_button.label = f"{self.current_page + 1}/{len(self.embeds)}"
+        self.prev_button.disabled = self.current_page == 0
+        self.next_button.disabled = self.current_page == len(self.embeds) - 1
+
+    # Internal async method to show another page, everybody can browse the pages
+    async def _show_page(self, interaction: discord.Interaction, page: int):
+        self.current_page = page
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.embeds[self.current_page], view=self)
+
+    async def prev_callback(self, interaction: discord.Interaction):
+        await self._show_page(interaction, max(0, self.current_page - 1))
+
+    async def next_callback(self, interaction: discord.Interaction):
+        await self._show_page(interaction, min(len(self.embeds) - 1, self.current_page + 1))
+
+    # Method called when view reaches timeout
+    async def on_timeout(self) -> None:
+        await self.close()
+
+    # Async method to stop the view and disable its buttons
+    async def close(self) -> None:
+        self.stop()
+        if self.live_views:
+            self.live_views.discard(self)
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                # The message was deleted
+                pass
+
+
 # This class is a Discord.py Cog, which groups commands, listeners, and translation logic
 class TranslatorCommand(commands.Cog):
     def __init__(self, bot):
         # Reference to the bot instance
         self.bot = bot
-        # Prepare lists of names and codes of languages for paginated views
-        self.source_name_list = [k for k in SOURCE_DICT.keys()]
-        self.source_code_list = [k for k in SOURCE_DICT.values()]
-        self.target_name_list = [k for k in TARGET_DICT.keys()]
-        self.target_code_list = [k for k in TARGET_DICT.values()]
+        # Configure the logger for this instance of the cog
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # After a hot reload the cog continues from the state of its previous instance
+        state = hot_reload.take_state(bot, self.qualified_name)
+        # Mapping (message id, target language) -> ids of the users waiting for the same flag translation
+        self.pending_reactions = state.get("pending_reactions", {})
+        # Recently reacted messages, so each one is fetched from Discord at most once
+        self.reacted_messages = state.get("reacted_messages", LRUCache(max_bytes=REACTED_MESSAGE_CACHE_BYTES,
+                                                                       ttl=REACTED_MESSAGE_CACHE_TTL))
+        # Fetches in progress, shared by the flags added at the same time to the same message
+        self.message_fetches = state.get("message_fetches", SingleFlight())
+        # Paginated results waiting for clicks, they hold their embeds in memory until they are closed
+        self.live_views = state.get("live_views", LiveViews(MAX_LIVE_VIEWS))
+
+    # Method called by the bot before a hot reload, the objects are shared with the new instance of the cog
+    # so the translations in progress complete against the same state
+    def export_state(self):
+        return {
+            "pending_reactions": self.pending_reactions,
+            "reacted_messages": self.reacted_messages,
+            "message_fetches": self.message_fetches,
+            "live_views": self.live_views,
+        }
+
+    # Method called when the cog is loaded, the persistent buttons are routed to the cog from now on
+    async def cog_load(self) -> None:
+        self.bot.add_dynamic_items(SendPrivateButton)
+        metrics.registry.collector("translator_views", self.live_views.stats)
+
+    # Method called when the cog is unloaded
+    async def cog_unload(self) -> None:
+        self.bot.remove_dynamic_items(SendPrivateButton)
+
+    # Method to build the embed showing a translated text, or one of its parts for long texts
+    def build_result_embed(self, original, translated, source_lang_code, target_lang_code, requesters,
+                           index=0, parts=1):
+        # Resolve the language names through the precomputed index
+        registry = get_registry()
+        source_language_name = registry.source_name(source_lang_code)
+        target_language_name = registry.target_name(target_lang_code)
+        # Only the first requesters are mentioned, the description of an embed is limited
+        mentions = ", ".join(f"<@{user_id}>" for user_id in list(requesters)[:MAX_MENTIONS])
+        if len(requesters) > MAX_MENTIONS:
+            mentions += f" and {len(requesters) - MAX_MENTIONS} others"
+        # Create an embed to show the translation result
+        embed = discord.Embed(
+            title="Your Translation" if parts == 1 else f"Your Translation ({index + 1}/{parts})",
+            color=discord.Color.blue(),
+            # Use the author's mention to make the message clearer
+            description=f"Here are the translation requested by {mentions}:"
+        )
+        embed.add_field(name=f"Original Text in {source_language_name}", value=original, inline=False)
+        # The translation can be longer than the original text, it is spread over several fields if needed
+        for number, piece in enumerate(split_text(translated, FIELD_LENGTH) if translated else ["Error"]):
+            embed.add_field(name=f"Translated to {target_language_name}" + (" (continued)" if number else ""),
+                            value=piece, inline=False)
+        # Set the footer and timestamp of the embed
+        embed.set_footer(text="Powered by Marsik24 \nSome languages may not be supported.",
+                         icon_url=self.bot.user.avatar.url if self.bot.user.avatar else None)
+        embed.timestamp = datetime.datetime.now()
+        return embed
 
     # Async method to perform translation and send the result
     async def perform_translation_and_send(self, interaction: discord.Interaction = None,
                                            message: discord.Message = None, text_to_translate: str = None,
                                            source_lang_code: str = None, target_lang_code: str = None,
-                                           reactor: discord.User = None, author: str = None):
+                                           reactor: discord.User = None, author: str = None,
+                                           pending_key: tuple = None):
+        # The guild is used to share the DeepL rate fairly between servers, the characters are counted
+        # against the budget of the guild and attributed to the channel and the user
+        if interaction:
+            guild_id, channel_id, user_id = interaction.guild_id, interaction.channel_id, interaction.user.id
+        else:
+            guild_id = message.guild.id if message.guild else None
+            channel_id, user_id = message.channel.id, author
+        # Long texts are split in segments that fit in the embed fields, translated concurrently
+        segments = split_text(text_to_translate, SEGMENT_LENGTH)
+        tasks = [asyncio.ensure_future(translation(segment, source=source_lang_code, target=target_lang_code,
+                                                   guild_id=guild_id, channel_id=channel_id, user_id=user_id))
+                 for segment in segments]
         try:
             # Performs translation using the imported function
-            text_translated, source_lang_code = translation(text_to_translate, source=source_lang_code,
-                                                            target=target_lang_code)
-            source_language_name = [name for name, code in SOURCE_DICT.items() if code == source_lang_code][0]
-            target_language_name = [name for name, code in TARGET_DICT.items() if code == target_lang_code.upper()][0]
-            # Create an embed to show the translation result
-            embed = discord.Embed(
-                title="Your Translation",
-                color=discord.Color.blue(),
-                # Use the author's mention to make the message clearer
-                description=f"Here are the translation requested by <@{author}>:"
-            )
-            embed.add_field(name=f"Original Text in {source_language_name}", value=text_to_translate, inline=False)
-            embed.add_field(name=f"Translated to {target_language_name}",
-                            value=text_translated if text_translated else "Error", inline=False)
-            # Set the footer and timestamp of the embed
-            embed.set_footer(text="Powered by Marsik24 \nSome languages may not be supported.",
-                             icon_url=self.bot.user.avatar.url if self.bot.user.avatar else None)
-            embed.timestamp = datetime.datetime.now()
-
-            # Create a view with the “Send to DM” button, Pass the original text of the message
-            view = SendPrivateButton(original_text=message, text_to_send=text_translated, author=author)
-            # Decide where to send the embed message based on whether the interaction is a slash command or a reaction
+            text_translated, detected_lang_code = await tasks[0]
+            # Collect the users who asked for the same flag translation while it was queued or in progress
+            requesters = self.pending_reactions.pop(pending_key, None)
+            # The text was already in the target language, there is nothing to translate
+            if text_translated == segments[0] and base_code(detected_lang_code) == base_code(target_lang_code):
+                notice = f"This message is already in {get_registry().source_name(detected_lang_code)}."
+                if interaction:
+                    await interaction.followup.send(notice, ephemeral=True)
+                elif message:
+                    await message.channel.send(notice, delete_after=10)
+                return
+            # Each part is sent as soon as it is translated, in order, so the first one shows up quickly
+            for index, (segment, task) in enumerate(zip(segments, tasks)):
+                text_translated, detected_lang_code = await task
+                embed = self.build_result_embed(segment, text_translated, detected_lang_code, target_lang_code,
+                                                requesters or [user_id], index, len(segments))
+
+                # Create a view with the “Send to DM” button for the users who requested the translation
+                view = private_button_view(requesters or [user_id])
+                # Decide where to send the embed message based on whether the interaction is a slash command or a reaction
+                if interaction:
+                    with metrics.SEND_LATENCY.time("interaction"):
+                        await interaction.followup.send(embed=embed, view=view)
+                elif message:
+                    # This branch is activated for reactions
+                    with metrics.SEND_LATENCY.time("reaction"):
+                        await message.channel.send(embed=embed, view=view)
+
+        except (CircuitOpenError, QuotaExceededError) as e:
+            self.pending_reactions.pop(pending_key, None)
+            # DeepL is unhealthy or the guild has no budget left, the request is rejected without waiting
             if interaction:
-                view.message = await interaction.followup.send(embed=embed, view=view)
+                await interaction.followup.send(f"{e}.", ephemeral=True)
             elif message:
-                # This branch is activated for reactions
-                await message.channel.send(embed=embed, view=view)
-
+                await message.channel.send(f"{e}.")
         except Exception as e:
-            print(f"Error during translation: {e}")
+            self.logger.error(f"Error during translation: {e}\n{traceback.format_exc()}")
+            # Following reactions to the same message start a new translation
+            self.pending_reactions.pop(pending_key, None)
             # Send an error message to the appropriate channel
             if interaction:
                 await interaction.followup.send(f"An error occurred during translation: {e}", ephemeral=True)
             elif message:
                 await message.channel.send(f"An error occurred during translation: {e}")
-
-    # This method is called every time a reaction is added to a message.
+        finally:
+            # The segments not delivered because of an error are not needed anymore
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Mark the errors of the other segments as retrieved, only the first one was reported
+                    task.exception()
+
+    # Async method to translate a text to several languages concurrently and send them in a single paginated message
+    async def perform_multi_translation(self, interaction: discord.Interaction = None,
+                                        message: discord.Message = None, text_to_translate: str = None,
+                                        target_lang_codes: list = None, author: str = None,
+                                        pending_key: tuple = None):
+        if interaction:
+            guild_id, channel_id, user_id = interaction.guild_id, interaction.channel_id, interaction.user.id
+        else:
+            guild_id = message.guild.id if message.guild else None
+            channel_id, user_id = message.channel.id, author
+        segments = split_text(text_to_translate, SEGMENT_LENGTH)
+        pages = [(target, index, segment) for target in target_lang_codes for index, segment in enumerate(segments)]
+        # Every language and part is requested at once, the cached results are reused and the others are batched
+        results = await asyncio.gather(*(translation(segment, target=target, guild_id=guild_id,
+                                                     channel_id=channel_id, user_id=user_id)
+                                         for target, _, segment in pages), return_exceptions=True)
+        requesters = self.pending_reactions.pop(pending_key, None) or [user_id]
+        embeds = []
+        for (target, index, segment), result in zip(pages, results):
+            if isinstance(result, Exception):
+                embed = discord.Embed(title="Translation failed", color=discord.Color.red(),
+                                      description=f"{get_registry().target_name(target)}: {result}")
+            else:
+                embed = self.build_result_embed(segment, result[0], result[1], target, requesters,
+                                                index, len(segments))
+            embeds.append(embed)
+        view = PagedResultView(embeds, self.live_views)
+        if interaction:
+            with metrics.SEND_LATENCY.time("interaction"):
+                view.message = await interaction.followup.send(embed=embeds[0], view=view)
+        elif message:
+            with metrics.SEND_LATENCY.time("reaction"):
+                view.message = await message.channel.send(embed=embeds[0], view=view)
+        # Embeds count their characters, most of them are stored once in memory
+        self.live_views.add(view, sum(len(embed) for embed in embeds))
+
+    # Method to read a list of target languages given as codes or names, it returns (codes, unknown entries)
+    def parse_targets(self, text: str):
+        registry = get_registry()
+        codes, unknown = [], []
+        for entry in filter(None, (entry.strip() for entry in text.split(","))):
+            code = entry.upper() if registry.is_target(entry) else registry.target_code(entry)
+            if code is None:
+                unknown.append(entry)
+            elif code not in codes:
+                codes.append(code)
+        return codes[:MAX_TARGETS], unknown
+
+    # Method returning the target languages of the multi-target translation for a guild
+    def get_preset(self, guild_id):
+        return GUILD_PRESETS.get(guild_id) or DEFAULT_PRESET
+
+    # Async method to run the translation through the bot's job queue, the request is rejected if the queue is full
+    async def queue_translation(self, priority, handler=None, **kwargs):
+        # The job translates to a single language unless another handler is given
+        handler = handler or self.perform_translation_and_send
+        interaction = kwargs.get("interaction")
+        deadline = None
+        if interaction:
+            # Jobs still waiting when the interaction expires are dropped
+            remaining = interaction.created_at + INTERACTION_LIFETIME - discord.utils.utcnow()
+            deadline = time.monotonic() + remaining.total_seconds()
+        try:
+            await self.bot.jobs.submit(lambda: handler(**kwargs), priority, deadline)
+        except QueueFullError as e:
+            self.pending_reactions.pop(kwargs.get("pending_key"), None)
+            if interaction:
+                await interaction.followup.send(str(e), ephemeral=True)
+            else:
+                await kwargs["message"].channel.send(str(e), delete_after=10)
+        except DeadlineExceededError:
+            # The interaction expired, there is no way left to answer it
+            pass
+
+    # Async method returning the reacted message, from the local cache or fetched once from Discord
+    async def get_reacted_message(self, payload: discord.RawReactionActionEvent):
+        message = self.reacted_messages.get(payload.message_id)
+        if message is None:
+            message = await self.message_fetches.do(payload.message_id, lambda: self._fetch_reacted_message(payload))
+        return message
+
+    # Internal async method to fetch a reacted message and store its content in the local cache
+    async def _fetch_reacted_message(self, payload: discord.RawReactionActionEvent):
+        channel = self.bot.get_partial_messageable(payload.channel_id, guild_id=payload.guild_id)
+        fetched = await channel.fetch_message(payload.message_id)
+        message = ReactedMessage(fetched.id, fetched.content, channel, payload.guild_id)
+        self.reacted_messages.set(message.id, message, len(message.content.encode("utf-8")) + 100)
+        return message
+
+    # This method is called every time a reaction is added to a message, even if the message is not in the cache
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
-        # Ignore reactions added by the bot itself
-        if user.bot:
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        # Custom emojis are never flags
+        if payload.emoji.id is not None:
+            return
+        # Check if the reaction emoji is mapped to a language, or asks for all the languages of the guild preset
+        emoji = payload.emoji.name.replace("\ufe0f", "")
+        if emoji == MULTI_TRANSLATE_EMOJI:
+            target_language_code = tuple(self.get_preset(payload.guild_id))
+            if not target_language_code:
+                return
+        else:
+            # The flags are read from the index of the translation module, swapped by the bot when the file changes
+            target_language_code = get_flags().get(emoji)
+        if target_language_code is None:
+            return
+        # Ignore reactions added by bots, including the bot itself
+        if payload.user_id == self.bot.user.id or (payload.member and payload.member.bot):
             return
 
-        # Check if the reaction emoji is mapped to a language
-        if reaction.emoji in EMOJI_TO_LANGUAGE:
-            target_language_code = EMOJI_TO_LANGUAGE[reaction.emoji]
-            # The message to which the reaction was added
-            message = reaction.message
+        # Removes user reaction for cleaning or to prevent re-triggering, without fetching the message
+        channel = self.bot.get_partial_messageable(payload.channel_id, guild_id=payload.guild_id)
+        await channel.get_partial_message(payload.message_id).remove_reaction(payload.emoji,
+                                                                             discord.Object(payload.user_id))
+
+        # If the same translation is already pending, the user is added to its requesters
+        key = (payload.message_id, target_language_code)
+        if key in self.pending_reactions:
+            self.pending_reactions[key].append(str(payload.user_id))
+            return
+        self.pending_reactions[key] = [str(payload.user_id)]
 
-            # Removes user reaction for cleaning or to prevent re-triggering
-            await reaction.remove(user)
+        try:
+            # The message to which the reaction was added
+            message = await self.get_reacted_message(payload)
+        except discord.HTTPException:
+            # The message was deleted or cannot be read
+            self.pending_reactions.pop(key, None)
+            return
 
-            # Translates based on the message content and the language of the reaction
-            await self.perform_translation_and_send(
+        # Translates based on the message content and the languages of the preset
+        if isinstance(target_language_code, tuple):
+            await self.queue_translation(
+                REACTION,
+                handler=self.perform_multi_translation,
                 message=message,
                 text_to_translate=message.content,
-                target_lang_code=target_language_code,
-                reactor=user,
-                author=str(user.id)
+                target_lang_codes=list(target_language_code),
+                author=str(payload.user_id),
+                pending_key=key
             )
+            return
+
+        # Translates based on the message content and the language of the reaction
+        await self.queue_translation(
+            REACTION,
+            message=message,
+            text_to_translate=message.content,
+            target_lang_code=target_language_code,
+            reactor=payload.member,
+            author=str(payload.user_id),
+            pending_key=key
+        )
+
+    # This method is called when a message is edited, the cached content of a reacted message becomes outdated
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        self.reacted_messages.pop(payload.message_id)
 
     # Allows the user to specify both the source and target languages
     @app_commands.command(name="translate_from_to", description="translate from a source language to a target language")
@@ -261,7 +618,7 @@ class TranslatorCommand(commands.Cog):
         await interaction.response.defer(ephemeral=True)
 
         # Requires the user to select the source language via a paginated view
-        source_lang_view = PagedLanguageView(self.source_code_list, self.source_name_list, is_from=True)
+        source_lang_view = PagedLanguageView(get_registry().source_pages, is_from=True)
         source_lang_code = await source_lang_view.prompt(interaction)
 
         if source_lang_code is None:
@@ -269,7 +626,7 @@ class TranslatorCommand(commands.Cog):
             return
 
         # Requires the user to select the target language via a paginated view
-        target_lang_view = PagedLanguageView(self.target_code_list, self.target_name_list, is_from=False)
+        target_lang_view = PagedLanguageView(get_registry().target_pages, is_from=False)
         # Update the original message with the new view for selecting the target language
         await interaction.edit_original_response(view=target_lang_view)
         target_lang_code = await target_lang_view.prompt(interaction)
@@ -280,7 +637,8 @@ class TranslatorCommand(commands.Cog):
             return
 
         # Translates using the selected languages
-        await self.perform_translation_and_send(
+        await self.queue_translation(
+            INTERACTION,
             interaction=interaction,
             message=message,
             text_to_translate=message,
@@ -296,7 +654,7 @@ class TranslatorCommand(commands.Cog):
         # Set the interaction to “loading” (ephemeral = visible only to the user)
         await interaction.response.defer(ephemeral=True)
         # Requires the user to select the target language
-        target_lang_view = PagedLanguageView(self.target_code_list, self.target_name_list, is_from=False)
+        target_lang_view = PagedLanguageView(get_registry().target_pages, is_from=False)
         await interaction.edit_original_response(view=target_lang_view)
         target_lang_code = await target_lang_view.prompt(interaction)
 
@@ -306,7 +664,8 @@ class TranslatorCommand(commands.Cog):
             return
 
         # Performs the translation, DeepL will automatically detect the source language
-        await self.perform_translation_and_send(
+        await self.queue_translation(
+            INTERACTION,
             interaction=interaction,
             message=message,
             text_to_translate=message,
@@ -315,12 +674,62 @@ class TranslatorCommand(commands.Cog):
         )
 
 
+    # Translates to several languages at once, given as codes or names, or to the languages of the guild preset
+    @app_commands.command(name="translate_multi", description="translate to several languages at once")
+    @app_commands.describe(targets="comma-separated languages, codes or names, the server preset if omitted")
+    async def translate_multi(self, interaction: discord.Interaction, message: str, targets: str = None):
+        # Set the interaction to “loading” (ephemeral = visible only to the user)
+        await interaction.response.defer(ephemeral=True)
+        if targets:
+            target_lang_codes, unknown = self.parse_targets(targets)
+            if unknown:
+                await interaction.followup.send(f"Unknown languages: {', '.join(unknown)}", ephemeral=True)
+                return
+        else:
+            target_lang_codes = self.get_preset(interaction.guild_id)
+        if not target_lang_codes:
+            await interaction.followup.send("No target languages given and no preset set for this server.",
+                                            ephemeral=True)
+            return
+        await self.queue_translation(
+            INTERACTION,
+            handler=self.perform_multi_translation,
+            interaction=interaction,
+            text_to_translate=message,
+            target_lang_codes=target_lang_codes,
+            author=interaction.user.id
+        )
+
+    # Sets the languages used by /translate_multi and by the multi-language reaction in this server
+    @app_commands.command(name="translate_preset", description="set the languages of the multi-language translation")
+    @app_commands.describe(targets="comma-separated languages, codes or names, empty to remove the preset")
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.guild_only()
+    async def translate_preset(self, interaction: discord.Interaction, targets: str = ""):
+        target_lang_codes, unknown = self.parse_targets(targets)
+        if unknown:
+            await interaction.response.send_message(f"Unknown languages: {', '.join(unknown)}", ephemeral=True)
+            return
+        if target_lang_codes:
+            await GUILD_PRESETS.set(interaction.guild_id, target_lang_codes)
+            names = ", ".join(get_registry().target_name(code) for code in target_lang_codes)
+            await interaction.response.send_message(f"Multi-language preset set to: {names}", ephemeral=True)
+        else:
+            await GUILD_PRESETS.delete(interaction.guild_id)
+            await interaction.response.send_message("Multi-language preset removed.", ephemeral=True)
+
+
 # Function required by discord.py to load a Cog
 async def setup(bot):
     await bot.add_cog(TranslatorCommand(bot))
     bot.tree.add_command(translate_message_context)
 
 
+# Function called by discord.py when the extension is unloaded, the context menu is registered again by the next setup
+async def teardown(bot):
+    bot.tree.remove_command(translate_message_context.name, type=translate_message_context.type)
+
+
 # This command appears when a user right-clicks on a message
 @app_commands.context_menu(name="Translate Message")
 async def translate_message_context(interaction: discord.Interaction, message: discord.Message):
@@ -329,13 +738,8 @@ async def translate_message_context(interaction: discord.Interaction, message: d
     if translator_cog:
         await interaction.response.defer(ephemeral=True)
 
-        source_name_list = [k for k in SOURCE_DICT.keys()]
-        source_code_list = [k for k in SOURCE_DICT.values()]
-        target_name_list = [k for k in TARGET_DICT.keys()]
-        target_code_list = [k for k in TARGET_DICT.values()]
-
         # Requires the user to select the source language
-        source_lang_view = PagedLanguageView(source_code_list, source_name_list, is_from=True)
+        source_lang_view = PagedLanguageView(get_registry().source_pages, is_from=True)
         source_lang_code = await source_lang_view.prompt(interaction)
 
         if source_lang_code is None:
@@ -343,7 +747,7 @@ async def translate_message_context(interaction: discord.Interaction, message: d
             return
 
         # Requires the user to select the target language
-        target_lang_view = PagedLanguageView(target_code_list, target_name_list, is_from=False)
+        target_lang_view = PagedLanguageView(get_registry().target_pages, is_from=False)
         await interaction.edit_original_response(view=target_lang_view)
         target_lang_code = await target_lang_view.prompt(interaction)
 
@@ -353,7 +757,8 @@ async def translate_message_context(interaction: discord.Interaction, message: d
             return
 
         # Performs translation using the Cog TranslatorCommand method
-        await translator_cog.perform_translation_and_send(
+        await translator_cog.queue_translation(
+            INTERACTION,
             interaction=interaction,
             message=message,
             text_to_translate=message.content,
@@ -0,0 +1,44 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import translation
+
+
+# This class is a Discord.py Cog reporting the characters translated by each server, read from the local counters
+class UsageCommand(commands.Cog):
+    def __init__(self, bot):
+        # Reference to the bot instance
+        self.bot = bot
+
+    # Method to build the embed with the usage of a guild
+    def build_usage_embed(self, guild_id):
+        usage = translation.usage_tracker.usage(guild_id)
+        budget = f" of {usage['budget']}" if usage["budget"] else ""
+        embed = discord.Embed(title=f"Translation usage {usage['period']}", color=discord.Color.blue(),
+                              description=f"{usage['characters']}{budget} characters translated by this server.")
+        if usage["channels"]:
+            embed.add_field(name="Channels", inline=True,
+                            value="\n".join(f"<#{channel}>: {characters}" for channel, characters in usage["channels"]))
+        if usage["users"]:
+            embed.add_field(name="Users", inline=True,
+                            value="\n".join(f"<@{user}>: {characters}" for user, characters in usage["users"]))
+        # Usage of the whole DeepL account, as of the last reconciliation
+        account = translation.usage_tracker.account
+        if account.get("character_limit"):
+            embed.add_field(name="Bot", inline=False,
+                            value=f"{account['character_count']} of {account['character_limit']} characters")
+        embed.set_footer(text="Powered by Marsik24 \nCached translations are not counted.")
+        return embed
+
+    # Shows the characters translated in this server during the current month, without calling DeepL
+    @app_commands.command(name="usage", description="show the characters translated by this server this month")
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.guild_only()
+    async def usage(self, interaction: discord.Interaction):
+        await interaction.response.send_message(embed=self.build_usage_embed(interaction.guild_id), ephemeral=True,
+                                                allowed_mentions=discord.AllowedMentions.none())
+
+
+# Function required by discord.py to load a Cog
+async def setup(bot):
+    await bot.add_cog(UsageCommand(bot))
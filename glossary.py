@@ -0,0 +1,137 @@
+import asyncio
+import os
+import types
+from languages import base_code
+from storage import JsonStore
+
+# Maximum number of terms of a glossary, for each language pair of a guild
+MAX_ENTRIES = int(os.getenv("GLOSSARY_MAX_ENTRIES", "1000"))
+# Maximum length of a term and of its translation
+MAX_TERM_LENGTH = 200
+
+# Glossaries of a guild without any glossary synced with DeepL
+_NO_GLOSSARIES = types.MappingProxyType({})
+
+
+# Exception raised when a glossary change is not valid
+class GlossaryError(Exception):
+    pass
+
+
+# Function returning the language pair of a glossary, DeepL glossaries apply to all the variants of a language
+def pair(source, target):
+    return f"{base_code(source)}-{base_code(target)}"
+
+
+# This class keeps the glossaries of the guilds, stored locally and indexed in memory by language pair.
+# Each change creates a new version, synced to a new DeepL glossary whose id identifies that version
+class GlossaryRegistry:
+    def __init__(self, store):
+        # Local document guild id -> {language pair -> {"entries": {term: translation}, "version": number,
+        # "synced_version": number, "deepl_id": id of the DeepL glossary or None}}
+        self.store = store
+        # Index guild id -> {language pair -> DeepL glossary id}, only the glossaries synced with DeepL
+        self._index = {}
+        for guild_id in self.store.data:
+            self._reindex(guild_id)
+        # Locks serializing the syncs of each glossary, (guild id, language pair) -> lock
+        self._locks = {}
+
+    # Internal method to rebuild the index of a guild after a change
+    def _reindex(self, guild_id):
+        guild_id = str(guild_id)
+        ids = {key: glossary["deepl_id"] for key, glossary in self.store.get(guild_id, {}).items()
+               if glossary.get("deepl_id")}
+        if ids:
+            self._index[guild_id] = types.MappingProxyType(ids)
+        else:
+            self._index.pop(guild_id, None)
+
+    # Returns the DeepL glossary ids of a guild, language pair -> id
+    def ids(self, guild_id):
+        if guild_id is None:
+            return _NO_GLOSSARIES
+        return self._index.get(str(guild_id), _NO_GLOSSARIES)
+
+    # Returns the DeepL glossary id to use for a language pair, or None
+    def lookup(self, guild_id, source, target):
+        return self.ids(guild_id).get(pair(source, target))
+
+    # Returns the glossaries of a guild, language pair -> glossary
+    def glossaries(self, guild_id):
+        return self.store.get(guild_id, {})
+
+    # Returns a glossary of a guild, or None
+    def get(self, guild_id, key):
+        return self.glossaries(guild_id).get(key)
+
+    # Returns the lock serializing the syncs of a glossary
+    def lock(self, guild_id, key):
+        return self._locks.setdefault((str(guild_id), key), asyncio.Lock())
+
+    # Async method to change the terms of a glossary, a None translation removes the term.
+    # It returns the language pair of the glossary, which needs to be synced with DeepL
+    async def update(self, guild_id, source, target, changes):
+        key = pair(source, target)
+        glossaries = dict(self.glossaries(guild_id))
+        glossary = glossaries.get(key) or {"entries": {}, "version": 0, "synced_version": 0, "deepl_id": None}
+        entries = dict(glossary["entries"])
+        for term, translation in changes.items():
+            if translation is None:
+                entries.pop(term, None)
+            else:
+                _validate(term, translation)
+                entries[term] = translation
+        if len(entries) > MAX_ENTRIES:
+            raise GlossaryError(f"A glossary can have at most {MAX_ENTRIES} terms")
+        if entries == glossary["entries"]:
+            return key
+        glossaries[key] = {**glossary, "entries": entries, "version": glossary["version"] + 1}
+        await self.store.set(guild_id, glossaries)
+        return key
+
+    # Async method to record that a version of a glossary was synced with DeepL, an empty glossary is removed
+    async def mark_synced(self, guild_id, key, version, deepl_id):
+        glossaries = dict(self.glossaries(guild_id))
+        glossary = glossaries.get(key)
+        if glossary is None:
+            return
+        if not glossary["entries"] and glossary["version"] == version:
+            del glossaries[key]
+        else:
+            glossaries[key] = {**glossary, "synced_version": version, "deepl_id": deepl_id}
+        if glossaries:
+            await self.store.set(guild_id, glossaries)
+        else:
+            await self.store.delete(guild_id)
+        self._reindex(guild_id)
+
+    # Returns the (guild id, language pair) of the glossaries changed since their last sync
+    def unsynced(self):
+        return [(guild_id, key) for guild_id, glossaries in self.store.data.items()
+                for key, glossary in glossaries.items() if glossary["synced_version"] != glossary["version"]]
+
+    # Returns the counters of the registry
+    def stats(self):
+        return {
+            "guilds": len(self.store.data),
+            "glossaries": sum(len(glossaries) for glossaries in self.store.data.values()),
+            "synced_glossaries": sum(len(ids) for ids in self._index.values()),
+            "unsynced_glossaries": len(self.unsynced()),
+        }
+
+
+# Internal function to check a term and its translation, DeepL glossaries are sent as tab-separated values
+def _validate(term, translation):
+    for text in (term, translation):
+        if not text or text != text.strip():
+            raise GlossaryError("Terms cannot be empty or start or end with spaces")
+        if any(character in text for character in "\t\n\r"):
+            raise GlossaryError("Terms cannot contain tabs or line breaks")
+        if len(text) > MAX_TERM_LENGTH:
+            raise GlossaryError(f"Terms can be at most {MAX_TERM_LENGTH} characters long")
+
+
+# Function to create the glossary registry from the environment variables
+def from_env():
+    return GlossaryRegistry(JsonStore(os.getenv("GLOSSARY_PATH", "glossaries.json")))
@@ -0,0 +1,46 @@
+import os
+
+
+# This class polls the modification time of the extension files and of the configuration files.
+# Polling a handful of files is cheap and needs no extra dependency
+class FileWatcher:
+    def __init__(self, directory, files=()):
+        # Directory of the extensions, every module not starting with "_" is watched
+        self.directory = directory
+        # Other files watched, such as emoji_config.json
+        self.files = list(files)
+        # Last seen (modification time, size) of each file, path -> stamp
+        self.stamps = self.scan()
+        # Files changed during the last poll, reported once they stop changing
+        self.settling = set()
+
+    # Returns the current stamp of the watched files, the missing ones are left out
+    def scan(self):
+        paths = list(self.files)
+        if os.path.isdir(self.directory):
+            paths += [os.path.join(self.directory, filename) for filename in os.listdir(self.directory)
+                      if filename.endswith(".py") and not filename.startswith("_")]
+        stamps = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    # Returns the paths created, changed or deleted, once they did not change between two calls.
+    # A file still being written is reported when its writer is done, not half-saved
+    def changes(self):
+        stamps = self.scan()
+        changed = {path for path in stamps.keys() | self.stamps.keys() if stamps.get(path) != self.stamps.get(path)}
+        ready = sorted(self.settling - changed)
+        self.settling = changed
+        self.stamps = stamps
+        return ready
+
+
+# Function used by the cogs when they are created, it returns the state handed over by their previous instance
+# during a hot reload, or an empty dictionary
+def take_state(bot, cog_name):
+    return getattr(bot, "carried_state", {}).pop(cog_name, {})
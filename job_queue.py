@@ -0,0 +1,125 @@
+import asyncio
+import itertools
+import os
+import time
+import metrics
+
+# Priority of the jobs coming from interactions, their followup must be sent within 15 minutes
+INTERACTION = 0
+# Priority of the jobs coming from flag reactions
+REACTION = 1
+# Names of the priorities used as metric labels
+PRIORITY_NAMES = {INTERACTION: "interaction", REACTION: "reaction"}
+# Fraction of the queue that reactions can fill, the rest is kept free for interactions
+REACTION_SHARE = 0.9
+
+
+# Exception raised when a job is rejected because the queue is full
+class QueueFullError(Exception):
+    pass
+
+
+# Exception set on a job that waited in the queue beyond its deadline
+class DeadlineExceededError(Exception):
+    pass
+
+
+# This class is a bounded priority queue of translation jobs served by a fixed pool of workers
+class JobQueue:
+    def __init__(self, workers=32, max_depth=1000):
+        # Number of jobs served concurrently
+        self.workers = workers
+        # Maximum number of jobs waiting in the queue
+        self.max_depth = max_depth
+        self._queue = asyncio.PriorityQueue(maxsize=max_depth)
+        # Sequence number keeping the jobs with the same priority in arrival order
+        self._sequence = itertools.count()
+        self._tasks = []
+        # Counters exposed as metrics
+        self.submitted = 0
+        self.shed = 0
+        self.expired = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.service_seconds = 0.0
+
+    # Starts the workers
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    # Async method to stop the workers, the jobs still waiting are discarded
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # Adds a job to the queue and returns the future of its result, raises QueueFullError if it is shed
+    def submit(self, factory, priority=REACTION, deadline=None):
+        limit = self.max_depth if priority == INTERACTION else int(self.max_depth * REACTION_SHARE)
+        if self._queue.qsize() >= limit:
+            self.shed += 1
+            raise QueueFullError("The bot is too busy right now, please try again in a moment.")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((priority, next(self._sequence), time.monotonic(), deadline, factory, future))
+        self.submitted += 1
+        return future
+
+    # Internal async method run by each worker
+    async def _worker(self):
+        while True:
+            priority, _, enqueued, deadline, factory, future = await self._queue.get()
+            start = time.monotonic()
+            wait = start - enqueued
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            metrics.QUEUE_WAIT.observe(wait, PRIORITY_NAMES.get(priority, str(priority)))
+            try:
+                if future.done():
+                    continue
+                # The result of a job past its deadline could not be delivered anyway
+                if deadline is not None and start > deadline:
+                    self.expired += 1
+                    future.set_exception(DeadlineExceededError("The job expired while waiting in the queue"))
+                    continue
+                try:
+                    result = await factory()
+                except Exception as e:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self.completed += 1
+                    if not future.done():
+                        future.set_result(result)
+                self.service_seconds += time.monotonic() - start
+            finally:
+                self._queue.task_done()
+
+    # Returns the counters of the queue
+    def stats(self):
+        served = self.completed + self.failed
+        return {
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "shed": self.shed,
+            "expired": self.expired,
+            "completed": self.completed,
+            "failed": self.failed,
+            "average_wait_seconds": self.wait_seconds / (served + self.expired) if served + self.expired else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "average_service_seconds": self.service_seconds / served if served else 0.0,
+        }
+
+
+# Function to create the job queue from the environment variables
+def from_env():
+    return JobQueue(
+        workers=int(os.getenv("JOB_WORKERS", "32")),
+        max_depth=int(os.getenv("JOB_QUEUE_SIZE", "1000")),
+    )
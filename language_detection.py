@@ -0,0 +1,156 @@
+import os
+import re
+import unicodedata
+
+# Most frequent short words of the languages written in the Latin script supported by DeepL,
+# a handful of them is enough to tell the languages apart on chat messages
+STOPWORDS = {
+    "EN": "the and is are was to of in that it you for on with this have not be at but they what there i my me your",
+    "DE": "der die das und ist nicht ich du sie es ein eine zu mit auf den dem für von sich auch wir ihr aber wie",
+    "FR": "le la les et est un une des pas je tu il elle que qui dans pour sur avec ce vous nous mais du au",
+    "ES": "el la los las y es un una que de no en por para con lo se como pero del al muy yo tu esta",
+    "IT": "il lo la gli le e è un una che di non per con sono io tu questo ma anche del della mi ti ci",
+    "PT": "o a os as e é um uma que de não em para com se do da mas eu você isso muito está são",
+    "NL": "de het een en is van ik je niet dat die op te met voor zijn maar ook wat er hij we",
+    "PL": "i w nie na się to jest z że do jak ale tak co mnie jestem być ten czy już",
+    "SV": "och att det är en som på för med inte jag du har av till den om så vi men",
+    "DA": "og at det er en som på for med ikke jeg du har af til den om så vi men",
+    "NB": "og at det er en som på for med ikke jeg du har av til den om så vi men hva",
+    "FI": "ja on ei se että en minä sinä hän me mutta kun niin kuin ole tämä mitä oli",
+    "CS": "a je to se na že v jsem není s by jak ale do tak co jako už",
+    "SK": "a je to sa na že v som nie s by ako ale do tak čo už aj",
+    "SL": "in je da se na ne v sem ki za s pa tudi bi kot to ali",
+    "RO": "și este în nu un o că de la cu pe se mai dar ce sunt eu tu",
+    "HU": "a az és hogy nem egy van is de ez meg csak már el mint ha",
+    "TR": "ve bir bu da de ne için çok ben sen o ama gibi var değil mi",
+    "ID": "dan yang di ini itu tidak saya kamu dengan untuk ada ke dari akan juga",
+    "ET": "ja on ei see et ma sa ta me aga kui nii mis oli olen",
+    "LV": "un ir ka es tu nav ar par to bet kā uz vai no",
+    "LT": "ir yra kad aš tu ne su už tai bet kaip į ar iš",
+}
+STOPWORDS = {code: frozenset(words.split()) for code, words in STOPWORDS.items()}
+# Letters that only appear in one of the languages written in Cyrillic. Bulgarian has no letter of its own,
+# the ъ it uses most is also written in Russian
+CYRILLIC_MARKERS = {"UK": set("іїєґ"), "RU": set("ыэё")}
+# Minimum number of letters a text must have to be classified
+MIN_LETTERS = int(os.getenv("DETECT_MIN_LETTERS", "12"))
+# Only the beginning of long texts is analysed
+SAMPLE_LENGTH = 1000
+# Targets that only differ from their base language in spelling, target -> base language
+SPELLING_VARIANTS = {"EN-GB": "EN", "EN-US": "EN"}
+
+# Regular expression splitting a text in words
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+# Internal function returning the script of a character, from its unicode name
+def _script(character):
+    name = unicodedata.name(character, "")
+    for script in ("HANGUL", "HIRAGANA", "KATAKANA", "CJK", "CYRILLIC", "GREEK", "ARABIC", "LATIN"):
+        if name.startswith(script):
+            return script
+    return None
+
+
+# Function to detect the language of a text, it returns (language code, confidence) or (None, 0.0)
+def detect(text):
+    text = text[:SAMPLE_LENGTH]
+    letters = [character for character in text if character.isalpha()]
+    if len(letters) < MIN_LETTERS:
+        return None, 0.0
+    scripts = {}
+    for character in letters:
+        script = _script(character)
+        scripts[script] = scripts.get(script, 0) + 1
+    script, count = max(scripts.items(), key=lambda item: item[1])
+    share = count / len(letters)
+    # Languages with their own script are recognized from the characters alone
+    if script == "HANGUL":
+        return "KO", share
+    if script in ("HIRAGANA", "KATAKANA", "CJK"):
+        # Japanese texts mix kanji with kana, Chinese texts do not
+        kana = scripts.get("HIRAGANA", 0) + scripts.get("KATAKANA", 0)
+        if kana:
+            return "JA", (kana + scripts.get("CJK", 0)) / len(letters)
+        return "ZH", share
+    if script == "GREEK":
+        return "EL", share
+    if script == "ARABIC":
+        return "AR", share
+    if script == "CYRILLIC":
+        lowered = set(text.lower())
+        for code, markers in CYRILLIC_MARKERS.items():
+            if lowered & markers:
+                return code, share
+        # Without marker letters the text is most likely Russian, but it could also be Bulgarian,
+        # the confidence stays below the thresholds to skip the translation or to fill in the source language
+        return "RU", share * 0.7
+    if script != "LATIN":
+        return None, 0.0
+    return _detect_latin(text, share)
+
+
+# Internal function to detect a language written in the Latin script from its most frequent words
+def _detect_latin(text, share):
+    words = _WORDS.findall(text.lower())
+    if not words:
+        return None, 0.0
+    scores = sorted(((sum(word in stopwords for word in words), code) for code, stopwords in STOPWORDS.items()),
+                    reverse=True)
+    (best, code), (second, _) = scores[0], scores[1]
+    if best == 0:
+        return None, 0.0
+    # The confidence grows with the share of recognized words and with the margin over the runner-up
+    coverage = min(1.0, best / max(3, len(words) * 0.3))
+    margin = (best - second) / best
+    return code, share * coverage * (0.5 + 0.5 * margin)
+
+
+# This class decides, before calling DeepL, whether a translation can be skipped or its source language filled in
+class PreDetector:
+    def __init__(self, skip_confidence=0.8, fill_confidence=0.95):
+        # Minimum confidence to return the text untranslated when it is already in the target language
+        self.skip_confidence = skip_confidence
+        # Minimum confidence to send the detected language as source language
+        self.fill_confidence = fill_confidence
+        # Counters exposed as metrics
+        self.detections = 0
+        self.skipped_calls = 0
+        self.skipped_characters = 0
+        self.filled_sources = 0
+
+    # Returns the detected language code and whether the translation can be skipped
+    def check(self, text, target, source_codes):
+        code, confidence = detect(text)
+        self.detections += 1
+        if code is None:
+            return None, False
+        # Only the base language is detected. English variants only differ in spelling, so an English text is
+        # skipped for EN-GB and EN-US, but PT-BR, PT-PT, ZH-HANS and ZH-HANT are always translated: the text
+        # could be in the other variant, such as simplified Chinese for ZH-HANT
+        if confidence >= self.skip_confidence and code in (target.upper(), SPELLING_VARIANTS.get(target.upper())):
+            self.skipped_calls += 1
+            self.skipped_characters += len(text)
+            return code, True
+        # The detected language is only used as source language if DeepL supports it
+        if confidence >= self.fill_confidence and code in source_codes:
+            self.filled_sources += 1
+            return code, False
+        return None, False
+
+    # Returns the counters of the detector
+    def stats(self):
+        return {
+            "detections": self.detections,
+            "skipped_calls": self.skipped_calls,
+            "skipped_characters": self.skipped_characters,
+            "filled_sources": self.filled_sources,
+        }
+
+
+# Function to create the detector from the environment variables, DETECT_SKIP_CONFIDENCE above 1 disables skipping
+def from_env():
+    return PreDetector(
+        skip_confidence=float(os.getenv("DETECT_SKIP_CONFIDENCE", "0.8")),
+        fill_confidence=float(os.getenv("DETECT_FILL_CONFIDENCE", "0.95")),
+    )
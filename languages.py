@@ -0,0 +1,62 @@
+import types
+import discord
+
+# Maximum number of options Discord allows in a select menu
+PAGE_SIZE = 25
+
+
+# This class is an immutable index of the languages supported by DeepL, built once per catalog update
+class LanguageRegistry:
+    def __init__(self, source=None, target=None):
+        # Dictionaries language name -> language code, as returned by get_source_language() and get_target_language()
+        self.source = types.MappingProxyType(dict(source or {}))
+        self.target = types.MappingProxyType(dict(target or {}))
+        # Reverse dictionaries language code -> language name
+        self._source_names = {normalize(code): name for name, code in self.source.items()}
+        self._target_names = {normalize(code): name for name, code in self.target.items()}
+        # Codes accepted as source language
+        self.source_codes = frozenset(self._source_names)
+        # Case-insensitive dictionaries language name -> language code
+        self._source_codes = {name.casefold(): code for name, code in self.source.items()}
+        self._target_codes = {name.casefold(): code for name, code in self.target.items()}
+        # Select menu options split in pages, shared by every PagedLanguageView
+        self.source_pages = _paginate(self.source)
+        self.target_pages = _paginate(self.target)
+
+    # Returns the name of a source language, accepting regional variants such as "EN-GB"
+    def source_name(self, code):
+        code = normalize(code)
+        return self._source_names.get(code) or self._source_names.get(base_code(code)) or code
+
+    # Returns the name of a target language, accepting generic codes such as "EN" returned by DeepL
+    def target_name(self, code):
+        code = normalize(code)
+        return self._target_names.get(code) or self._source_names.get(base_code(code)) or code
+
+    # Returns the code of a source language from its name, or None
+    def source_code(self, name):
+        return self._source_codes.get(name.casefold())
+
+    # Returns the code of a target language from its name, or None
+    def target_code(self, name):
+        return self._target_codes.get(name.casefold())
+
+    # Returns True if the code is a supported target language
+    def is_target(self, code):
+        return normalize(code) in self._target_names
+
+
+# Function to normalize a language code, DeepL codes are case-insensitive
+def normalize(code):
+    return (code or "").strip().upper()
+
+
+# Function to obtain the generic language of a regional variant, "EN-GB" -> "EN"
+def base_code(code):
+    return normalize(code).split("-")[0]
+
+
+# Internal function to split the languages in pages of select menu options
+def _paginate(languages):
+    options = [discord.SelectOption(label=name, value=code) for name, code in languages.items()]
+    return tuple(tuple(options[i:i + PAGE_SIZE]) for i in range(0, len(options), PAGE_SIZE))
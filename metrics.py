@@ -0,0 +1,191 @@
+import asyncio
+import bisect
+import os
+import time
+from aiohttp import web
+
+# Default upper bounds in seconds of the latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# This class is a counter with optional labels, incrementing it only updates a dictionary
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        # Mapping label values -> value
+        self.values = {}
+
+    def inc(self, amount=1, *label_values):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name, _labels(self.labels, label_values), value
+
+
+# This class is a gauge with optional labels
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+
+# This class is a histogram with fixed buckets and optional labels
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Mapping label values -> [count per bucket, sum, count], the counts are cumulated only when exported
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        data = self.values.get(label_values)
+        if data is None:
+            data = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    # Context manager measuring the time spent in a block
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def samples(self):
+        for label_values, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", _labels((*self.labels, "le"), (*label_values, le)), cumulative
+            yield f"{self.name}_sum", _labels(self.labels, label_values), total
+            yield f"{self.name}_count", _labels(self.labels, label_values), count
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+# This class collects the metrics and renders them in the Prometheus text format
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Functions returning the counters of a component as a dictionary, read only when the metrics are scraped,
+        # mapping prefix -> function
+        self.collectors = {}
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # Registers a function returning a dictionary of numbers, each one exported as a gauge named prefix_key,
+    # it replaces the function registered with the same prefix, such as the one of a reloaded extension
+    def collector(self, prefix, function):
+        self.collectors[prefix] = function
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        for prefix, function in self.collectors.items():
+            try:
+                stats = function()
+            except Exception:
+                # A component not initialized yet has nothing to export
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Internal function to format the labels of a sample
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+# Registry shared by the whole bot
+registry = Registry()
+
+# Metrics of the translation hot path
+QUEUE_WAIT = registry.histogram("translator_queue_wait_seconds", "Time spent by the jobs waiting in the queue",
+                                labels=("priority",))
+UPSTREAM_LATENCY = registry.histogram("translator_upstream_seconds", "Time spent sending a batch to DeepL")
+SEND_LATENCY = registry.histogram("translator_send_seconds", "Time spent sending the result to Discord",
+                                  labels=("kind",))
+TRANSLATIONS = registry.counter("translator_translations_total", "Translations requested",
+                                labels=("result",))
+CHARACTERS = registry.counter("translator_characters_total", "Characters sent to DeepL",
+                              labels=("guild", "source", "target"))
+DOCUMENTS = registry.counter("translator_documents_total", "Documents sent to DeepL", labels=("result",))
+GLOSSARY_SYNCS = registry.counter("translator_glossary_syncs_total", "Glossaries synced with DeepL",
+                                  labels=("result",))
+RELOAD_LATENCY = registry.histogram("translator_reload_seconds", "Time spent reloading an extension or a configuration",
+                                    labels=("result",))
+DEEPL_USAGE = registry.gauge("translator_deepl_usage", "Usage of the DeepL account in the billing period",
+                             labels=("kind",))
+SHARD_READY = registry.gauge("translator_shard_ready_seconds", "Seconds from process start to shard ready",
+                             labels=("shard",))
+SHARD_GUILDS = registry.gauge("translator_shard_guilds", "Guilds served by each shard", labels=("shard",))
+LOOP_LAG = registry.histogram("translator_event_loop_lag_seconds", "Delay of the event loop",
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+
+# Async function measuring the delay of the event loop, a sleep lasting longer than requested means the loop is busy
+async def monitor_event_loop(interval=1.0):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+# Async function to start the local HTTP server exposing the /metrics endpoint
+async def start_server(host="127.0.0.1", port=9108):
+    async def handler(request):
+        return web.Response(body=registry.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# Function to read the address of the metrics server from the environment variables, port 0 disables it
+def address_from_env():
+    return os.getenv("METRICS_HOST", "127.0.0.1"), int(os.getenv("METRICS_PORT", "9108"))
@@ -0,0 +1,147 @@
+import datetime
+import os
+from storage import JsonStore
+
+
+# Exception raised without calling DeepL when a guild has used its character budget
+class QuotaExceededError(Exception):
+    def __init__(self, used, budget):
+        super().__init__(f"This server has not enough translation budget left this month "
+                         f"({used} of {budget} characters used)")
+        # Characters used in the current period and budget of the guild
+        self.used = used
+        self.budget = budget
+
+
+# Function returning the accounting period of a date, DeepL budgets are monthly
+def current_period(now=None):
+    return (now or datetime.datetime.now(datetime.UTC)).strftime("%Y-%m")
+
+
+# This class counts the characters sent to DeepL per guild, channel and user, and enforces the guild budgets.
+# The counters live in memory and are saved periodically by flush(), the hot path never touches the disk
+class UsageTracker:
+    def __init__(self, store, guild_budget=0, guild_budgets=None):
+        # Local document with the counters of the current period
+        self.store = store
+        # Characters each guild can translate per period, 0 means unlimited, with overrides per guild id
+        self.guild_budget = guild_budget
+        self.guild_budgets = {str(guild): budget for guild, budget in (guild_budgets or {}).items()}
+        # True when the counters changed since the last flush
+        self.dirty = False
+        # Last usage of the whole account read from DeepL, and the local total at that time
+        self.account = {}
+        # Counters exposed as metrics
+        self.rejected = 0
+        self._start_period()
+
+    # Internal method to start counting a new period, the counters of the previous one are dropped
+    def _start_period(self):
+        period = current_period()
+        if self.store.get("period") != period:
+            self.store.data.clear()
+            self.store.data["period"] = period
+            self.dirty = True
+        # Counters guild id -> {"characters": total, "channels": {id: total}, "users": {id: total}},
+        # the translations requested in DMs are counted under the "dm" guild
+        self.guilds = self.store.data.setdefault("guilds", {})
+
+    # Internal method returning the counters of a guild, the period is renewed when the month changes
+    def _guild(self, guild_id, create=False):
+        if self.store.get("period") != current_period():
+            self._start_period()
+        key = str(guild_id or "dm")
+        if create and key not in self.guilds:
+            self.guilds[key] = {"characters": 0, "channels": {}, "users": {}}
+        return self.guilds.get(key)
+
+    # Returns the budget of a guild in characters, 0 means unlimited
+    def budget(self, guild_id):
+        if guild_id is None:
+            return 0
+        return self.guild_budgets.get(str(guild_id), self.guild_budget)
+
+    # Returns the characters used by a guild in the current period
+    def used(self, guild_id):
+        guild = self._guild(guild_id)
+        return guild["characters"] if guild else 0
+
+    # Raises QuotaExceededError if the guild cannot send these characters to DeepL
+    def check(self, guild_id, characters=0):
+        budget = self.budget(guild_id)
+        if not budget:
+            return
+        used = self.used(guild_id)
+        if used + characters > budget:
+            self.rejected += 1
+            raise QuotaExceededError(used, budget)
+
+    # Adds the characters sent to DeepL to the counters of the guild, of the channel and of the user
+    def record(self, characters, guild_id=None, channel_id=None, user_id=None):
+        guild = self._guild(guild_id, create=True)
+        guild["characters"] += characters
+        if channel_id is not None:
+            channel = str(channel_id)
+            guild["channels"][channel] = guild["channels"].get(channel, 0) + characters
+        if user_id is not None:
+            user = str(user_id)
+            guild["users"][user] = guild["users"].get(user, 0) + characters
+        self.dirty = True
+
+    # Returns the usage of a guild: total, budget and the channels and users that used the most characters
+    def usage(self, guild_id, top=5):
+        guild = self._guild(guild_id) or {"characters": 0, "channels": {}, "users": {}}
+        return {
+            "period": self.store.get("period"),
+            "characters": guild["characters"],
+            "budget": self.budget(guild_id),
+            "channels": sorted(guild["channels"].items(), key=lambda item: item[1], reverse=True)[:top],
+            "users": sorted(guild["users"].items(), key=lambda item: item[1], reverse=True)[:top],
+        }
+
+    # Returns the characters counted locally for all the guilds in the current period
+    def total(self):
+        return sum(guild["characters"] for guild in self.guilds.values())
+
+    # Async method saving the counters to the local file, only when they changed
+    async def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        await self.store.save()
+
+    # Stores the usage of the account returned by the DeepL /usage endpoint, it returns the characters
+    # billed by DeepL that were not counted locally, sent by other clients of the same key or lost in a restart
+    def reconcile(self, account_usage):
+        self.account = {**account_usage, "local_characters": self.total()}
+        return account_usage.get("character_count", 0) - self.account["local_characters"]
+
+    # Returns the counters of the tracker
+    def stats(self):
+        stats = {
+            "characters": self.total(),
+            "guilds": len(self.guilds),
+            "rejected": self.rejected,
+        }
+        if self.account:
+            stats["account_characters"] = self.account.get("character_count", 0)
+            stats["account_limit"] = self.account.get("character_limit", 0)
+        return stats
+
+
+# Function to read the budgets of the guilds, GUILD_BUDGETS is a comma-separated list of guild_id:characters
+def _parse_budgets(value):
+    budgets = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(","))):
+        guild, _, characters = entry.partition(":")
+        budgets[guild.strip()] = int(characters)
+    return budgets
+
+
+# Function to create the usage tracker from the environment variables
+def from_env():
+    return UsageTracker(
+        JsonStore(os.getenv("USAGE_PATH", "usage.json")),
+        guild_budget=int(os.getenv("GUILD_BUDGET", "0")),
+        guild_budgets=_parse_budgets(os.getenv("GUILD_BUDGETS", "")),
+    )
@@ -0,0 +1,227 @@
+import asyncio
+import collections
+import os
+import random
+import time
+import aiohttp
+
+# Lowest fraction of the configured rate the adaptive limiter can slow down to
+MIN_RATE_FACTOR = 0.1
+# Fraction of the configured rate recovered after each successful request
+RECOVERY_FACTOR = 0.05
+
+
+# Exception raised without calling DeepL while the circuit breaker is open
+class CircuitOpenError(Exception):
+    def __init__(self, retry_in):
+        super().__init__(f"DeepL is temporarily unavailable, retry in {retry_in:.0f}s")
+        # Seconds before DeepL will be tried again
+        self.retry_in = retry_in
+
+
+# This class is a token bucket whose rate adapts to the 429 responses of DeepL
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        # Configured rate in requests per second, the current rate never goes above it
+        self.max_rate = rate
+        self.rate = rate
+        # Maximum number of requests that can be sent in a burst
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        # No request is allowed before this time, set by the Retry-After header
+        self._blocked_until = 0.0
+
+    # Async method that waits until a request can be sent
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            # Add the tokens generated since the last update
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    # Halves the rate and pauses the bucket after a 429 response
+    def throttle(self, retry_after=None):
+        self.rate = max(self.max_rate * MIN_RATE_FACTOR, self.rate / 2)
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    # Slowly restores the rate after a successful request
+    def recover(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FACTOR)
+
+
+# This class limits the requests sent to DeepL globally and the translations requested by each guild
+class RateLimiter:
+    def __init__(self, rate=10.0, guild_rate=2.0, guild_burst=5, max_guilds=10000):
+        # Bucket shared by every request sent to DeepL
+        self.global_bucket = TokenBucket(rate)
+        # Rate and burst allowed to each guild
+        self.guild_rate = guild_rate
+        self.guild_burst = guild_burst
+        # Buckets of the guilds that translated recently, the least recently used are dropped
+        self.max_guilds = max_guilds
+        self._guild_buckets = collections.OrderedDict()
+
+    # Async method that waits until a request can be sent to DeepL
+    async def acquire(self):
+        await self.global_bucket.acquire()
+
+    # Async method that waits until the guild is allowed another translation
+    async def acquire_guild(self, guild_id):
+        if guild_id is None:
+            return
+        bucket = self._guild_buckets.get(guild_id)
+        if bucket is None:
+            bucket = TokenBucket(self.guild_rate, self.guild_burst)
+            self._guild_buckets[guild_id] = bucket
+            if len(self._guild_buckets) > self.max_guilds:
+                self._guild_buckets.popitem(last=False)
+        else:
+            self._guild_buckets.move_to_end(guild_id)
+        await bucket.acquire()
+
+    def throttle(self, retry_after=None):
+        self.global_bucket.throttle(retry_after)
+
+    def recover(self):
+        self.global_bucket.recover()
+
+
+# This class stops calling DeepL after repeated failures and lets a single probe through after a pause
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        # Number of consecutive failures that opens the circuit
+        self.failure_threshold = failure_threshold
+        # Seconds the circuit stays open before a probe is allowed
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        # True while the probe of the half-open state is in progress
+        self._probing = False
+
+    # Raises CircuitOpenError if the call must not reach DeepL
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+        retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+        if self.state == self.OPEN and retry_in <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpenError(max(retry_in, 0.0))
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    # Gives back the probe of a call cancelled before its result, the next call probes again
+    def release_probe(self):
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+# This class sends the requests to DeepL through the rate limiter and the circuit breaker, retrying transient errors
+class ResilientCaller:
+    def __init__(self, limiter, breaker, attempts=3, base_delay=0.5, max_delay=8.0):
+        self.limiter = limiter
+        self.breaker = breaker
+        # Maximum number of attempts for each request
+        self.attempts = attempts
+        # Base and maximum delay of the exponential backoff
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Counters exposed as metrics
+        self.retries = 0
+        self.throttled = 0
+
+    # Async method calling the coroutine factory until it succeeds, fails permanently or runs out of attempts,
+    # requests that cannot be replayed pass attempts=1 and callers that already waited for the rate limiter
+    # before the first attempt pass acquired=True
+    async def call(self, factory, attempts=None, acquired=False):
+        attempts = attempts or self.attempts
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            try:
+                if attempt or not acquired:
+                    await self.limiter.acquire()
+                result = await factory()
+            except asyncio.CancelledError:
+                # A call cancelled by a timeout of the caller says nothing about DeepL
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                status = getattr(e, "status", None)
+                retry_after = getattr(e, "retry_after", None)
+                if status == 429:
+                    # DeepL is healthy but we are going too fast
+                    self.throttled += 1
+                    self.limiter.throttle(retry_after)
+                    self.breaker.record_success()
+                elif _is_transient(e):
+                    self.breaker.record_failure()
+                else:
+                    # Errors caused by the request itself are not retried and do not open the circuit
+                    self.breaker.record_success()
+                    raise
+                if attempt == attempts - 1:
+                    raise
+                self.retries += 1
+                # Exponential backoff with full jitter, unless DeepL said how long to wait
+                await asyncio.sleep(retry_after or random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            else:
+                self.breaker.record_success()
+                self.limiter.recover()
+                return result
+
+    # Returns the counters of the limiter and the circuit breaker
+    def stats(self):
+        return {
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "rate": self.limiter.global_bucket.rate,
+            "circuit_open": int(self.breaker.state != CircuitBreaker.CLOSED),
+            "consecutive_failures": self.breaker.failures,
+        }
+
+
+# Internal function to check whether an error is caused by a temporary problem of DeepL or of the network
+def _is_transient(e):
+    status = getattr(e, "status", None)
+    if status is not None:
+        return status >= 500
+    return isinstance(e, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+# Function to create the rate limiter and the resilient caller from the environment variables
+def from_env():
+    limiter = RateLimiter(
+        rate=float(os.getenv("DEEPL_RATE", "10")),
+        guild_rate=float(os.getenv("DEEPL_GUILD_RATE", "2")),
+        guild_burst=int(os.getenv("DEEPL_GUILD_BURST", "5")),
+    )
+    breaker = CircuitBreaker(
+        failure_threshold=int(os.getenv("CIRCUIT_FAILURES", "5")),
+        reset_timeout=float(os.getenv("CIRCUIT_RESET", "30")),
+    )
+    return ResilientCaller(limiter, breaker, attempts=int(os.getenv("DEEPL_ATTEMPTS", "3")))
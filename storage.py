@@ -0,0 +1,49 @@
+import asyncio
+import json
+import os
+
+
+# This class keeps a JSON document in memory and saves it to a local file after each change
+class JsonStore:
+    def __init__(self, path):
+        # File where the document is saved
+        self.path = path
+        # The whole document is cached in memory, reads never touch the disk
+        self.data = self._load()
+        # Serializes the writes, so an older version never overwrites a newer one
+        self._lock = asyncio.Lock()
+
+    # Internal method to read the document, an empty one is used if the file is missing or invalid
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key, default=None):
+        return self.data.get(str(key), default)
+
+    # Async method to change a value and save the document
+    async def set(self, key, value):
+        self.data[str(key)] = value
+        await self.save()
+
+    # Async method to remove a value and save the document
+    async def delete(self, key):
+        if self.data.pop(str(key), None) is not None:
+            await self.save()
+
+    # Async method to save the document in a worker thread, replacing the file atomically
+    async def save(self):
+        async with self._lock:
+            snapshot = json.dumps(self.data, ensure_ascii=False, indent=2)
+            await asyncio.to_thread(_write, self.path, snapshot)
+
+
+# Internal function to write a file atomically
+def _write(path, content):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temporary_path, path)
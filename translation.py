@@ -1,15 +1,258 @@
+import asyncio
 import os
+import re
+import types
 from dotenv import load_dotenv
-import deepl
+import aiohttp
 import json
+import batching
+import broker
+import cache
+import glossary
+import language_detection
+import metrics
+import quota
+import resilience
+from languages import LanguageRegistry
 
 # Load environment variables from the .env file
 load_dotenv()
 
 # Retrieve the DeepL API token from the environment variables
 TOKEN = os.getenv("TOKEN_DEEPL")
-# Initialize the DeepL translator object with the API token
-translator = deepl.Translator(TOKEN)
+# Base URL of the DeepL REST API, keys of the free plan end with ":fx" and use a dedicated host,
+# DEEPL_API_URL points the bot to another server such as the fake one of the benchmarks
+API_URL = os.getenv("DEEPL_API_URL") or (
+    "https://api-free.deepl.com/v2" if TOKEN and TOKEN.endswith(":fx") else "https://api.deepl.com/v2")
+# Maximum number of seconds a single request to DeepL may take before being aborted
+REQUEST_TIMEOUT = float(os.getenv("DEEPL_TIMEOUT", "10"))
+# File where the last language catalog downloaded from DeepL is saved, used for a cold start without network
+LANGUAGES_SNAPSHOT = os.getenv("LANGUAGES_SNAPSHOT", "languages_snapshot.json")
+# Language codes not offered as targets, DeepL requires their regional variants
+SKIP_TARGET_LANGUAGES = ["EN", "PT", "ZH"]
+# Index of the languages supported by DeepL, replaced as a whole each time the catalog is loaded
+registry = LanguageRegistry()
+# Async client shared by the whole bot, set by init_client() during the bot setup
+client = None
+# Two-tier cache of the translations already performed, set by init_client() during the bot setup
+translation_cache = None
+# Scheduler packing the pending translations into multi-text requests, set by init_client() during the bot setup
+batcher = None
+# Rate limiter, retries and circuit breaker protecting the requests to DeepL, set by init_client() during the bot setup
+caller = None
+# Characters sent to DeepL per guild, channel and user, with the guild budgets, set by init_client() during the bot setup
+usage_tracker = None
+# Glossaries of the guilds with the DeepL glossaries they are synced to, set by init_client() during the bot setup
+glossaries = None
+# File mapping the flag emojis to the language codes
+EMOJI_CONFIG = "emoji_config.json"
+# Index flag emoji -> language code, replaced as a whole each time the emoji configuration is loaded
+flags = None
+# Broker running the translations in worker processes, set by the bot when TRANSLATION_BROKER is configured
+remote = None
+# Offline language detection skipping the texts already in the target language
+detector = language_detection.from_env()
+# Maximum size in bytes of the documents sent to DeepL
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(10 * 1024 * 1024)))
+# Maximum number of seconds DeepL may take to translate a document
+DOCUMENT_TIMEOUT = float(os.getenv("DOCUMENT_TIMEOUT", "600"))
+# Size of the chunks the documents are streamed in
+DOCUMENT_CHUNK_SIZE = 64 * 1024
+# Extensions of the document formats supported by DeepL
+DOCUMENT_TYPES = frozenset({"docx", "pptx", "xlsx", "pdf", "htm", "html", "txt", "xlf", "xliff", "srt"})
+# First and maximum delay between two status requests of a document in translation
+DOCUMENT_POLL_DELAY = 1.0
+DOCUMENT_POLL_MAX_DELAY = 30.0
+
+
+# Exception raised when the DeepL API answers with an error status
+class TranslationError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f"DeepL API error {status}: {message}")
+        # HTTP status code returned by DeepL
+        self.status = status
+        # Seconds to wait before the next request, sent by DeepL with the 429 and 503 responses
+        self.retry_after = retry_after
+
+
+# Exception raised when a document, or its translation, is larger than allowed
+class DocumentTooLargeError(Exception):
+    def __init__(self, limit):
+        super().__init__(f"The document is larger than {limit / 1024 / 1024:.1f} MB")
+        # Maximum size in bytes
+        self.limit = limit
+
+
+# This class performs non-blocking requests to the DeepL API through a shared aiohttp session
+class DeepLClient:
+    def __init__(self, session, auth_key=TOKEN, api_url=API_URL, timeout=REQUEST_TIMEOUT):
+        # Session with pooled keep-alive connections, owned by the bot
+        self.session = session
+        # Base URL of the DeepL API
+        self.api_url = api_url
+        # Authentication header sent with every request
+        self.headers = {"Authorization": f"DeepL-Auth-Key {auth_key}"}
+        # Timeout applied to each request
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # Documents can take long to transfer, only a stalled connection is aborted
+        self.transfer_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+
+    # Translates a list of texts to the same target language with a single request
+    async def translate_text(self, texts, source="", target="EN-GB", glossary_id=None):
+        payload = {"text": list(texts), "target_lang": target}
+        # DeepL detects the source language automatically when it is omitted
+        if source:
+            payload["source_lang"] = source
+        # A glossary requires the source language
+        if glossary_id:
+            payload["glossary_id"] = glossary_id
+        async with self.session.post(f"{self.api_url}/translate", json=payload, headers=self.headers,
+                                     timeout=self.timeout) as response:
+            if response.status != 200:
+                raise TranslationError(response.status, await response.text(),
+                                       _parse_retry_after(response.headers.get("Retry-After")))
+            data = await response.json()
+        # Returns a (text, detected_source) pair for each text, in the same order
+        return [(item["text"], item["detected_source_language"]) for item in data["translations"]]
+
+    # Returns the list of languages supported by DeepL, kind is "source" or "target"
+    async def get_languages(self, kind):
+        async with self.session.get(f"{self.api_url}/languages", params={"type": kind}, headers=self.headers,
+                                    timeout=self.timeout) as response:
+            if response.status != 200:
+                raise TranslationError(response.status, await response.text())
+            return await response.json()
+
+    # Returns the characters and documents translated in the current billing period, with their limits
+    async def get_usage(self):
+        async with self.session.get(f"{self.api_url}/usage", headers=self.headers,
+                                    timeout=self.timeout) as response:
+            if response.status != 200:
+                raise TranslationError(response.status, await response.text(),
+                                       _parse_retry_after(response.headers.get("Retry-After")))
+            return await response.json()
+
+    # Creates a glossary from a dictionary term -> translation, it returns its glossary_id
+    async def create_glossary(self, name, source, target, entries):
+        payload = {"name": name, "source_lang": source, "target_lang": target, "entries_format": "tsv",
+                   "entries": "\n".join(f"{term}\t{translation}" for term, translation in entries.items())}
+        async with self.session.post(f"{self.api_url}/glossaries", json=payload, headers=self.headers,
+                                     timeout=self.timeout) as response:
+            if response.status not in (200, 201):
+                raise TranslationError(response.status, await response.text(),
+                                       _parse_retry_after(response.headers.get("Retry-After")))
+            return (await response.json())["glossary_id"]
+
+    # Deletes a glossary, a glossary already deleted is ignored
+    async def delete_glossary(self, glossary_id):
+        async with self.session.delete(f"{self.api_url}/glossaries/{glossary_id}", headers=self.headers,
+                                       timeout=self.timeout) as response:
+            if response.status not in (200, 204, 404):
+                raise TranslationError(response.status, await response.text(),
+                                       _parse_retry_after(response.headers.get("Retry-After")))
+
+    # Uploads a document read from an async iterable of chunks, it returns its document_id and document_key
+    async def upload_document(self, chunks, filename, target="EN-GB", source="", glossary_id=None):
+        form = aiohttp.FormData()
+        form.add_field("target_lang", target)
+        if source:
+            form.add_field("source_lang", source)
+        if glossary_id:
+            form.add_field("glossary_id", glossary_id)
+        # The chunks are forwarded as they arrive, the document is never held in memory as a whole
+        form.add_field("file", chunks, filename=filename, content_type="application/octet-stream")
+        async with self.session.post(f"{self.api_url}/document", data=form, headers=self.headers,
+                                     timeout=self.transfer_timeout) as response:
+            if response.status != 200:
+                raise TranslationError(response.status, await response.text(),
+                                       _parse_retry_after(response.headers.get("Retry-After")))
+            return await response.json()
+
+    # Returns the status of a document in translation, with the seconds remaining and the billed characters
+    async def get_document_status(self, document_id, document_key):
+        async with self.session.post(f"{self.api_url}/document/{document_id}", json={"document_key": document_key},
+                                     headers=self.headers, timeout=self.timeout) as response:
+            if response.status != 200:
+                raise TranslationError(response.status, await response.text(),
+                                       _parse_retry_after(response.headers.get("Retry-After")))
+            return await response.json()
+
+    # Streams a translated document into a writable binary file, it returns its size in bytes
+    async def download_document(self, document_id, document_key, output, max_bytes=None):
+        async with self.session.post(f"{self.api_url}/document/{document_id}/result",
+                                     json={"document_key": document_key}, headers=self.headers,
+                                     timeout=self.transfer_timeout) as response:
+            if response.status != 200:
+                raise TranslationError(response.status, await response.text(),
+                                       _parse_retry_after(response.headers.get("Retry-After")))
+            size = 0
+            async for chunk in response.content.iter_chunked(DOCUMENT_CHUNK_SIZE):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise DocumentTooLargeError(max_bytes)
+                output.write(chunk)
+            return size
+
+
+# This class merges concurrent calls with the same key into a single upstream call (single-flight)
+class SingleFlight:
+    def __init__(self):
+        # Mapping key -> task of the upstream call currently in progress
+        self._calls = {}
+        # Number of calls that joined an upstream call already in progress
+        self.coalesced = 0
+
+    # Async method that runs the coroutine factory once per key and shares its result with all the callers
+    async def do(self, key, factory):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+        # The shield keeps the shared call alive when one of the callers is cancelled
+        return await asyncio.shield(task)
+
+    # Internal callback to forget a finished call and mark its exception as retrieved
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self):
+        return len(self._calls)
+
+
+# Identical translations in progress, shared between the concurrent callers
+in_flight = SingleFlight()
+
+
+# Internal function to read the Retry-After header, DeepL sends it as a number of seconds
+def _parse_retry_after(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# Function to create the shared async client on top of the bot's aiohttp session, together with the cache
+def init_client(session):
+    global client, translation_cache, batcher, caller, usage_tracker, glossaries
+    client = DeepLClient(session)
+    # The limiter and the breaker keep their state when the session is replaced
+    if caller is None:
+        caller = resilience.from_env()
+    # The batcher waits for the rate limiter itself, so a throttled batch keeps growing instead of queuing
+    batcher = batching.from_env(_send_batch, acquire=caller.limiter.acquire)
+    if translation_cache is None:
+        translation_cache = cache.from_env()
+    if usage_tracker is None:
+        usage_tracker = quota.from_env()
+    if glossaries is None:
+        glossaries = glossary.from_env()
+    return client
 
 
 # Function to obtain flags (emoji) from a JSON configuration file
@@ -17,7 +260,7 @@ def get_flag():
     try:
         # Attempts to open and read the file 'emoji_config.json',
         # 'encoding='utf-8' ensures correct handling of special characters
-        with open('emoji_config.json', 'r', encoding='utf-8') as f:
+        with open(EMOJI_CONFIG, 'r', encoding='utf-8') as f:
             # Load the JSON content of the file into a variable 'flags'
             flags = json.load(f)
             return flags
@@ -33,66 +276,374 @@ def get_flag():
         return {}
 
 
+# Function to load the flag emojis, the index is replaced as a whole so readers never see a partial update.
+# The emojis are indexed without the variation selector, that some clients add and others do not
+def load_flags():
+    global flags
+    loaded = get_flag()
+    # A missing or invalid file keeps the flags loaded before, a half-saved file does not disable the reactions
+    if loaded or flags is None:
+        flags = types.MappingProxyType({emoji.replace("\ufe0f", ""): code for emoji, code in loaded.items()})
+    return flags
+
+
+# Function to obtain the index of the flag emojis, loaded on first use
+def get_flags():
+    return flags if flags is not None else load_flags()
+
+
 # Funzione per ottenere le informazioni sull'utilizzo dell'API DeepL.
-def get_usage():
-    # Retrieve the usage object from the DeepL translator.
-    usage = translator.get_usage()
+async def get_usage():
+    # Retrieve the usage of the account from DeepL, the local counters are reconciled with it
+    usage = await reconcile_usage()
     # Check if any translation limits have been reached
-    if usage.any_limit_reached:
+    if any(usage.get(f"{kind}_limit") and usage.get(f"{kind}_count", 0) >= usage[f"{kind}_limit"]
+           for kind in ("character", "document")):
         return 'Translation limit reached.'
     # If the character limit is valid
-    if usage.character.valid:
-        return f"Character usage: {usage.character.count} of {usage.character.limit}"
+    if usage.get("character_limit"):
+        return f"Character usage: {usage['character_count']} of {usage['character_limit']}"
     # If the document limit is valid
-    if usage.document.valid:
-        return f"Document usage: {usage.document.count} of {usage.document.limit}"
+    if usage.get("document_limit"):
+        return f"Document usage: {usage['document_count']} of {usage['document_limit']}"
 
 
-# Function to obtain a dictionary of source languages supported by DeepL
-def get_source_language():
-    # Initialize an empty dictionary for source languages
-    source_dict = {}
-    # Iterate over all source languages available via the DeepL API
-    for language in translator.get_source_languages():
-        # Create a new key-value pair
-        new_data = {language.name: language.code}
-        # Add the new pair to the source language dictionary
-        source_dict.update(new_data)
+# Async function to read the usage of the account from DeepL and compare it with the local counters
+async def reconcile_usage():
+    usage = await caller.call(client.get_usage)
+    metrics.DEEPL_USAGE.set(usage.get("character_count", 0), "character")
+    metrics.DEEPL_USAGE.set(usage.get("document_count", 0), "document")
+    if usage_tracker:
+        usage["untracked_characters"] = usage_tracker.reconcile(usage)
+    return usage
 
-    # Returns the dictionary of source languages
-    return source_dict
 
+# Function to obtain a dictionary of source languages supported by DeepL, read from the loaded catalog
+def get_source_language():
+    return registry.source
 
-# Function to obtain a dictionary of target languages supported by DeepL
+
+# Function to obtain a dictionary of target languages supported by DeepL, read from the loaded catalog
 def get_target_language():
-    # Initialize an empty dictionary for target languages
-    target_dict = {}
-    # Defines a list of language codes not to be included in the target dictionary
-    skip_language = ["EN", "PT", "ZH"]
-    # Itera on all target languages available via the DeepL API
-    for language in translator.get_target_languages():
-        # If the language code is in the skip list, ignore it
-        if language.code in skip_language:
-            pass
+    return registry.target
+
+
+# Function to obtain the index of the languages supported by DeepL
+def get_registry():
+    return registry
+
+
+# Function to read the language catalog saved by the last successful refresh
+def load_language_snapshot(path=LANGUAGES_SNAPSHOT):
+    global registry
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        registry = LanguageRegistry(snapshot["source"], snapshot["target"])
+        return True
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        # Without a valid snapshot the catalog has to be downloaded before being used
+        return False
+
+
+# Async function to download the language catalog from DeepL and save a snapshot of it
+async def refresh_languages(path=LANGUAGES_SNAPSHOT):
+    global registry
+    source_languages, target_languages = await asyncio.gather(client.get_languages("source"),
+                                                              client.get_languages("target"))
+    # Build the dictionaries language name -> language code
+    source_dict = {language["name"]: language["language"] for language in source_languages}
+    target_dict = {language["name"]: language["language"] for language in target_languages
+                   # Skip the generic variants, only the regional ones are offered as targets
+                   if language["language"] not in SKIP_TARGET_LANGUAGES}
+    # The registry is replaced as a whole so readers never see a partial update
+    registry = LanguageRegistry(source_dict, target_dict)
+    # The snapshot is written in a worker thread to avoid blocking the event loop
+    await asyncio.to_thread(_write_snapshot, path, {"source": source_dict, "target": target_dict})
+    return registry
+
+
+# Internal function to atomically write the language snapshot
+def _write_snapshot(path, catalog):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=2)
+    os.replace(temporary_path, path)
+
+
+# Boundaries used to split long texts, from the strongest to the weakest
+_SPLIT_PATTERNS = (re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"(?<=[.!?。！？])\s+"), re.compile(r"\s+"))
+
+
+# Function to split a text in segments of at most `limit` characters, at paragraph, line, sentence or word boundaries
+def split_text(text, limit=1024, _level=0):
+    if len(text) <= limit:
+        return [text]
+    if _level == len(_SPLIT_PATTERNS):
+        # No boundary left, the text is cut at the limit
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+    segments = []
+    current = ""
+    position = 0
+    # Each piece keeps the separator that follows it, so joining the segments gives back the text
+    for match in [*_SPLIT_PATTERNS[_level].finditer(text), None]:
+        end = match.end() if match else len(text)
+        piece = text[position:end]
+        position = end
+        if len(current) + len(piece) <= limit:
+            current += piece
+            continue
+        if current:
+            segments.append(current)
+        # A piece too long for a segment is split at the next weaker boundary
+        if len(piece) > limit:
+            *complete, current = split_text(piece, limit, _level + 1)
+            segments.extend(complete)
         else:
-            # Otherwise, create a new key-value pair
-            new_data = {language.name: language.code}
-            # Adds the new pair to the target language dictionary
-            target_dict.update(new_data)
+            current = piece
+    if current:
+        segments.append(current)
+    return segments
+
 
-    # Returns the dictionary of target languages
-    return target_dict
+# Function returning the DeepL glossary of a guild for a language pair, or None.
+# glossary_ids maps the language pairs to the glossary ids, read from the guild glossaries when omitted
+def find_glossary(guild_id, source, target, glossary_ids=None):
+    # DeepL only applies a glossary with an explicit source language
+    if not source:
+        return None
+    if glossary_ids is None:
+        glossary_ids = glossaries.ids(guild_id) if glossaries else {}
+    return glossary_ids.get(glossary.pair(source, target))
 
 
-# Main function to perform a translation
-def translation(text_original, source="", target="EN-GB"):
-    # Translates the text
-    result = translator.translate_text(text_original, source_lang=source, target_lang=target)
-    # Extracts the translated text from the result
-    text = result.text
-    # Extracts the source language detected by DeepL
-    detected_source = result.detected_source_lang
+# Main function to perform a translation, it never blocks the event loop.
+# The glossary of the guild for the language pair is applied automatically
+async def translation(text_original, source="", target="EN-GB", guild_id=None, channel_id=None, user_id=None,
+                      glossary_ids=None):
+    # With worker processes connected, the whole translation runs in one of them
+    if remote and remote.workers:
+        try:
+            return await _translate_remote(text_original, source, target, guild_id, channel_id, user_id)
+        except broker.NoWorkerError:
+            # The last worker disconnected, the text is translated in this process
+            pass
+    # Without a source language, a text already in the target language is returned as is
+    # and a language recognized with certainty is sent as source language
+    if not source:
+        detected, skip = detector.check(text_original, target, registry.source_codes)
+        if skip:
+            metrics.TRANSLATIONS.inc(1, "skipped")
+            return text_original, detected
+        source = detected or ""
+    # Each change of a glossary creates a new DeepL glossary, its id in the key gives the version of the glossary
+    glossary_id = find_glossary(guild_id, source, target, glossary_ids)
+    # Look for the same text already translated to the same language pair with the same glossary
+    key = cache.make_key(text_original, source, target, *([glossary_id] if glossary_id else []))
+    if translation_cache:
+        cached = await translation_cache.get(key)
+        if cached is not None:
+            metrics.TRANSLATIONS.inc(1, "cache_hit")
+            return cached
+    # The guild must have enough budget left before anything is sent to DeepL
+    if usage_tracker:
+        try:
+            usage_tracker.check(guild_id, len(text_original))
+        except quota.QuotaExceededError:
+            metrics.TRANSLATIONS.inc(1, "over_budget")
+            raise
+    metrics.TRANSLATIONS.inc(1, "upstream")
+    # Each guild gets a fair share of the requests sent to DeepL
+    await caller.limiter.acquire_guild(guild_id)
+    # Translates the text once, even when the same translation is requested concurrently
+    text, detected_source = await in_flight.do(
+        key, lambda: _translate_upstream(key, text_original, source, target, guild_id, channel_id, user_id,
+                                         glossary_id))
 
     # Returns the translated text and the detected source language
     return text, detected_source
 
+
+# Function counting the characters a worker sent to DeepL, the broker calls it for every reply
+def record_remote_usage(records):
+    if usage_tracker:
+        for characters, *ids in records:
+            usage_tracker.record(characters, *ids)
+
+
+# Internal function to translate a text in a worker process, the characters it sent to DeepL are counted
+# by record_remote_usage() as the replies arrive
+async def _translate_remote(text_original, source, target, guild_id, channel_id, user_id):
+    # The workers do not know the budgets, a guild without budget left is refused before the job is sent
+    if usage_tracker:
+        usage_tracker.check(guild_id, len(text_original))
+    # The workers do not read the glossaries, the ids of the guild are sent with the job
+    glossary_ids = dict(glossaries.ids(guild_id)) if glossaries else {}
+    reply = await remote.translate({"text": text_original, "source": source, "target": target,
+                                    "guild_id": guild_id, "channel_id": channel_id, "user_id": user_id,
+                                    "glossary_ids": glossary_ids})
+    if reply["op"] == "error":
+        if reply.get("type") == "CircuitOpenError":
+            raise resilience.CircuitOpenError(reply["retry_in"])
+        raise broker.RemoteTranslationError(reply["message"])
+    return reply["text"], reply["detected"]
+
+
+# Internal function to send a batch of texts to DeepL through the retries and the circuit breaker, the batcher
+# already waited for the rate limiter
+async def _send_batch(texts, source="", target="EN-GB", glossary_id=None):
+    with metrics.UPSTREAM_LATENCY.time():
+        return await caller.call(lambda: client.translate_text(texts, source=source, target=target,
+                                                               glossary_id=glossary_id), acquired=True)
+
+
+# Internal function to translate the text through the batcher and store the result in the cache
+async def _translate_upstream(key, text_original, source, target, guild_id=None, channel_id=None, user_id=None,
+                              glossary_id=None):
+    # The text is sent together with the other texts requested for the same language pair and glossary
+    result = await batcher.submit(text_original, source=source, target=target, glossary_id=glossary_id)
+    # Characters billed by DeepL, per guild and language pair
+    metrics.CHARACTERS.inc(len(text_original), guild_id or "dm", source or result[1], target)
+    # Characters counted against the budget of the guild, once even if the translation was requested concurrently
+    if usage_tracker:
+        usage_tracker.record(len(text_original), guild_id, channel_id, user_id)
+    # Stores the result for the next requests
+    if translation_cache:
+        await translation_cache.set(key, result)
+    return result
+
+
+# Async function to sync a changed glossary with DeepL, it returns the id of the DeepL glossary or None.
+# DeepL glossaries cannot be edited, a new one is created for each version and the previous one is deleted
+async def sync_glossary(guild_id, key):
+    async with glossaries.lock(guild_id, key):
+        current = glossaries.get(guild_id, key)
+        if current is None:
+            return None
+        if current["synced_version"] == current["version"]:
+            return current["deepl_id"]
+        version, previous_id, glossary_id = current["version"], current["deepl_id"], None
+        if current["entries"]:
+            source, target = key.split("-")
+            # Creating a glossary is not idempotent, so it is not retried
+            glossary_id = await caller.call(
+                lambda: client.create_glossary(f"Guild {guild_id} {key} v{version}", source, target,
+                                               current["entries"]), attempts=1)
+        # From now on the translations use the new glossary, under new cache keys
+        await glossaries.mark_synced(guild_id, key, version, glossary_id)
+        metrics.GLOSSARY_SYNCS.inc(1, "done")
+        if previous_id:
+            try:
+                await caller.call(lambda: client.delete_glossary(previous_id))
+            except Exception:
+                # A glossary left behind only takes space in the account
+                metrics.GLOSSARY_SYNCS.inc(1, "delete_failed")
+        return glossary_id
+
+
+# Async function to sync the glossaries changed while DeepL was not reachable, it returns the number of failures
+async def sync_glossaries():
+    failures = 0
+    for guild_id, key in glossaries.unsynced():
+        try:
+            await sync_glossary(guild_id, key)
+        except Exception:
+            metrics.GLOSSARY_SYNCS.inc(1, "failed")
+            failures += 1
+    return failures
+
+
+# Async function to read the limits of the DeepL account before a document is sent, it returns an error message or None
+async def check_document_usage():
+    usage = await reconcile_usage()
+    # The document limit only exists on some plans, the characters of the documents always count
+    if usage.get("document_limit") and usage.get("document_count", 0) >= usage["document_limit"]:
+        return "Document limit reached."
+    if usage.get("character_limit") and usage.get("character_count", 0) >= usage["character_limit"]:
+        return "Translation limit reached."
+    return None
+
+
+# Async generator passing a stream of chunks through, it fails as soon as the stream exceeds max_bytes
+async def limit_stream(chunks, max_bytes=DOCUMENT_MAX_BYTES):
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise DocumentTooLargeError(max_bytes)
+        yield chunk
+
+
+# Async function to send a document to DeepL, streamed from an async iterable of chunks.
+# It returns the (document_id, document_key) pair to pass to finish_document_translation()
+async def start_document_translation(chunks, filename, source="", target="EN-GB", guild_id=None):
+    # The glossary of the guild applies to the documents too
+    glossary_id = find_glossary(guild_id, source, target)
+    # The characters of a document are only known once translated, a guild with no budget left is refused
+    if usage_tracker:
+        usage_tracker.check(guild_id)
+    await caller.limiter.acquire_guild(guild_id)
+    try:
+        # The upload consumes the stream, so it cannot be retried
+        document = await caller.call(lambda: _upload_document(chunks, filename, target, source, glossary_id),
+                                     attempts=1)
+    except Exception:
+        metrics.DOCUMENTS.inc(1, "failed")
+        raise
+    return document["document_id"], document["document_key"]
+
+
+# Internal async function to upload a document whose size is only known once streamed. aiohttp wraps the
+# DocumentTooLargeError raised by the stream into a connection error, it is raised again as itself so that an
+# oversize document is not taken for a failure of DeepL by the circuit breaker
+async def _upload_document(chunks, filename, target, source, glossary_id):
+    try:
+        return await client.upload_document(limit_stream(chunks), filename, target, source, glossary_id)
+    except aiohttp.ClientError as e:
+        cause = e.__cause__ or e.__context__
+        while cause is not None and not isinstance(cause, DocumentTooLargeError):
+            cause = cause.__cause__ or cause.__context__
+        if cause is None:
+            raise
+        raise DocumentTooLargeError(cause.limit) from None
+
+
+# Async function to wait for a document to be translated and stream it into a writable binary file.
+# It returns the number of characters billed by DeepL
+async def finish_document_translation(document, output, source="", target="EN-GB", guild_id=None, channel_id=None,
+                                      user_id=None, max_bytes=None):
+    document_id, document_key = document
+    try:
+        status = await asyncio.wait_for(_wait_for_document(document_id, document_key), DOCUMENT_TIMEOUT)
+        await caller.call(lambda: _download_document(document_id, document_key, output, max_bytes))
+    except Exception:
+        metrics.DOCUMENTS.inc(1, "failed")
+        raise
+    billed_characters = status.get("billed_characters", 0)
+    metrics.DOCUMENTS.inc(1, "done")
+    metrics.CHARACTERS.inc(billed_characters, guild_id or "dm", source or "auto", target)
+    if usage_tracker:
+        usage_tracker.record(billed_characters, guild_id, channel_id, user_id)
+    return billed_characters
+
+
+# Internal async function polling the status of a document until it is translated, with an exponential backoff
+async def _wait_for_document(document_id, document_key):
+    delay = DOCUMENT_POLL_DELAY
+    while True:
+        status = await caller.call(lambda: client.get_document_status(document_id, document_key))
+        if status["status"] == "done":
+            return status
+        if status["status"] == "error":
+            raise TranslationError(422, status.get("error_message") or "the document could not be translated")
+        # DeepL estimates the time left once the translation started, the backoff is used until then
+        wait = status.get("seconds_remaining") or delay
+        await asyncio.sleep(min(max(wait, DOCUMENT_POLL_DELAY), DOCUMENT_POLL_MAX_DELAY))
+        delay = min(delay * 2, DOCUMENT_POLL_MAX_DELAY)
+
+
+# Internal async function downloading a translated document, a retry starts again from an empty file
+async def _download_document(document_id, document_key, output, max_bytes):
+    output.seek(0)
+    output.truncate()
+    return await client.download_document(document_id, document_key, output, max_bytes)
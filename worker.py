@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import os
+import traceback
+import aiohttp
+from dotenv import load_dotenv
+import broker
+import metrics
+import translation
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# Path of the Unix socket of the broker, the same TRANSLATION_BROKER of the bot
+BROKER_PATH = os.getenv("TRANSLATION_BROKER", "translator.sock")
+# Number of jobs each worker runs at the same time, they are batched together towards DeepL
+WORKER_SLOTS = int(os.getenv("WORKER_SLOTS", "64"))
+# Maximum delay between two attempts to connect to the broker, while the bot is restarting
+MAX_RECONNECT_DELAY = 30.0
+# Hours between two prunes of the persistent cache of the worker, the same CACHE_PRUNE_HOURS of the bot
+CACHE_PRUNE_HOURS = float(os.getenv("CACHE_PRUNE_HOURS", "1"))
+
+logger = logging.getLogger("TranslationWorker")
+
+
+# This class replaces the usage tracker in the workers: the budgets are checked by the bot before sending the jobs,
+# the characters sent to DeepL are collected and returned to the bot with the next reply
+class UsageForwarder:
+    def __init__(self):
+        # List of [characters, guild id, channel id, user id] not yet returned to the bot
+        self.records = []
+
+    def check(self, guild_id, characters=0):
+        pass
+
+    def record(self, characters, guild_id=None, channel_id=None, user_id=None):
+        self.records.append([characters, guild_id, channel_id, user_id])
+
+    # Returns the records collected since the last call
+    def take(self):
+        records, self.records = self.records, []
+        return records
+
+
+# Async function to run a job and build the reply for the broker
+async def run_job(job, usage):
+    args = job["args"]
+    try:
+        text, detected = await translation.translation(
+            args["text"], source=args["source"], target=args["target"], guild_id=args["guild_id"],
+            channel_id=args["channel_id"], user_id=args["user_id"], glossary_ids=args.get("glossary_ids", {}))
+        reply = {"op": "result", "id": job["id"], "text": text, "detected": detected}
+    except Exception as e:
+        reply = {"op": "error", "id": job["id"], "type": type(e).__name__, "message": str(e),
+                 "retry_in": getattr(e, "retry_in", None)}
+    reply["usage"] = usage.take()
+    return reply
+
+
+# Async function removing periodically the stale and the oldest translations of the persistent cache
+async def prune_cache():
+    while True:
+        await asyncio.sleep(CACHE_PRUNE_HOURS * 3600)
+        try:
+            await translation.translation_cache.prune()
+        except Exception:
+            logger.warning(f"Failed to prune translation cache\n{traceback.format_exc()}")
+
+
+# Async function serving a connection to the broker until it is closed
+async def serve(reader, writer, usage):
+    writer.write(broker.encode({"op": "hello", "slots": WORKER_SLOTS, "pid": os.getpid()}))
+    await writer.drain()
+    running = set()
+
+    # Async function running a job and sending its reply
+    async def handle(job):
+        reply = await run_job(job, usage)
+        try:
+            writer.write(broker.encode(reply))
+            await writer.drain()
+        except ConnectionError:
+            # The broker is gone, it gives the job to another worker
+            pass
+
+    try:
+        while line := await reader.readline():
+            task = asyncio.create_task(handle(json.loads(line)))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        # The broker gives the unanswered jobs to the other workers
+        for task in running:
+            task.cancel()
+        writer.close()
+
+
+# Async function to run the worker, it reconnects to the broker whenever the connection is lost
+async def run():
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=int(os.getenv("HTTP_POOL_SIZE", "100")), ttl_dns_cache=300,
+                                       keepalive_timeout=60)
+    )
+    usage = UsageForwarder()
+    # Set before init_client(), so the worker never writes the usage file of the bot
+    translation.usage_tracker = usage
+    translation.init_client(session)
+    port = int(os.getenv("WORKER_METRICS_PORT", "0"))
+    if port:
+        await metrics.start_server(os.getenv("METRICS_HOST", "127.0.0.1"), port)
+    pruning = asyncio.create_task(prune_cache())
+    delay = 1.0
+    try:
+        while True:
+            # The bot keeps the snapshot of the language catalog up to date
+            if not translation.load_language_snapshot():
+                try:
+                    await translation.refresh_languages()
+                except Exception:
+                    logger.warning(f"Failed to download language catalog\n{traceback.format_exc()}")
+            try:
+                reader, writer = await asyncio.open_unix_connection(BROKER_PATH, limit=broker.LINE_LIMIT)
+            except OSError:
+                logger.info(f"Broker {BROKER_PATH} not available, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+            delay = 1.0
+            logger.info(f"Connected to broker {BROKER_PATH}")
+            try:
+                await serve(reader, writer, usage)
+            except (ConnectionError, ValueError):
+                logger.warning(f"Connection to the broker lost\n{traceback.format_exc()}")
+    finally:
+        pruning.cancel()
+        await session.close()
+        if translation.translation_cache:
+            translation.translation_cache.close()
+
+
+# --- Main function ---
+def main() -> None:
+    # Configure basic logging
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(message)s")
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("Exiting...")
+
+
+# Check if the script is executed directly.
+if __name__ == "__main__":
+    main()